@@ -0,0 +1,427 @@
+import threading
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from models.models import Book, Branch, Change, Faculty, book_faculty
+from exceptions.exceptions import InvalidReportException
+
+GROUP_DIMENSIONS = ("branch", "publisher", "year", "faculty")
+BOOK_METRICS = ("price", "copies", "borrowed", "inventory_value", "borrow_rate")
+FULL_RELOAD_RATIO = 0.2
+REFRESH_CHUNK_SIZE = 500
+
+
+def _numpy():
+    import numpy
+
+    return numpy
+
+
+def _chunks(items: list):
+    for start in range(0, len(items), REFRESH_CHUNK_SIZE):
+        end = start + REFRESH_CHUNK_SIZE
+        yield items[start:end]
+
+
+def parse_percentiles(value: str) -> tuple:
+    try:
+        percentiles = tuple(float(item) for item in value.split(",") if item.strip())
+    except ValueError:
+        raise InvalidReportException(f"Недопустимые перцентили '{value}'")
+    if not percentiles or any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise InvalidReportException(f"Недопустимые перцентили '{value}'")
+    return percentiles
+
+
+class _Dictionary:
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class BookAnalytics:
+    """Колоночный снимок книг в массивах NumPy для отчётов по фонду и ценам"""
+
+    _STATE = (
+        "branches",
+        "publishers",
+        "faculties",
+        "branch_names",
+        "faculty_names",
+        "ids",
+        "branch_codes",
+        "publisher_codes",
+        "years",
+        "prices",
+        "copies",
+        "borrowed",
+        "alive",
+        "membership",
+    )
+
+    def __init__(self, min_refresh_interval: float = 1.0):
+        self.min_refresh_interval = min_refresh_interval
+        self.loaded = False
+        self.last_seq = 0
+        self.refreshed_at = 0.0
+        self.full_loads = 0
+        self.incremental_refreshes = 0
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    def _book_rows(self, db: Session, book_ids=None):
+        query = select(
+            Book.id,
+            Book.branch_id,
+            Book.publisher,
+            Book.year,
+            Book.price,
+            Book.copies_available,
+            Book.students_borrowed_count,
+        )
+        if book_ids is not None:
+            query = query.where(Book.id.in_(book_ids))
+        return db.execute(query.order_by(Book.id)).all()
+
+    def _link_rows(self, db: Session, book_ids=None):
+        query = select(book_faculty.c.book_id, book_faculty.c.faculty_id)
+        if book_ids is not None:
+            query = query.where(book_faculty.c.book_id.in_(book_ids))
+        return db.execute(query).all()
+
+    def _names(self, db: Session):
+        return (
+            dict(db.execute(select(Branch.id, Branch.name)).all()),
+            dict(db.execute(select(Faculty.id, Faculty.name)).all()),
+        )
+
+    def load(self, db: Session):
+        with self._refresh_lock:
+            self._load(db)
+
+    def _load(self, db: Session):
+        # Запросы к БД и сборка массивов идут без блокировки отчётов, под ней только подмена снимка
+        last_seq = db.query(func.coalesce(func.max(Change.seq), 0)).scalar()
+        rows = self._book_rows(db)
+        names = self._names(db)
+        links = self._link_rows(db)
+
+        fresh = BookAnalytics(self.min_refresh_interval)
+        fresh._build(rows, names, links)
+        with self._lock:
+            for name in self._STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.last_seq = last_seq
+            self.loaded = True
+            self.full_loads += 1
+            self.refreshed_at = time.monotonic()
+
+    def _build(self, rows, names, links):
+        np = _numpy()
+        self.branches = _Dictionary()
+        self.publishers = _Dictionary()
+        self.faculties = _Dictionary()
+        self.branch_names, self.faculty_names = names
+        for faculty_id in sorted(self.faculty_names):
+            self.faculties.encode(faculty_id)
+
+        size = len(rows)
+        self.ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=size)
+        self.branch_codes = np.fromiter((self.branches.encode(row.branch_id) for row in rows), np.int32, size)
+        self.publisher_codes = np.fromiter((self.publishers.encode(row.publisher) for row in rows), np.int32, size)
+        self.years = np.array([row.year for row in rows], dtype=np.float64).reshape(size)
+        self.prices = np.array([row.price for row in rows], dtype=np.float64).reshape(size)
+        self.copies = np.fromiter((row.copies_available or 0 for row in rows), np.int64, size)
+        self.borrowed = np.fromiter((row.students_borrowed_count or 0 for row in rows), np.int64, size)
+        self.alive = np.ones(size, dtype=bool)
+        self.membership = np.zeros((size, len(self.faculties.values)), dtype=bool)
+
+        if links:
+            book_ids = np.fromiter((link.book_id for link in links), np.int64, len(links))
+            columns = np.fromiter((self.faculties.encode(link.faculty_id) for link in links), np.int64, len(links))
+            self._ensure_faculty_columns()
+            self.membership[np.searchsorted(self.ids, book_ids), columns] = True
+
+    def _ensure_faculty_columns(self):
+        np = _numpy()
+        missing = len(self.faculties.values) - self.membership.shape[1]
+        if missing > 0:
+            self.membership = np.hstack([self.membership, np.zeros((len(self.ids), missing), dtype=bool)])
+
+    def _append_rows(self, rows):
+        np = _numpy()
+        size = len(rows)
+        self.ids = np.concatenate([self.ids, np.zeros(size, dtype=np.int64)])
+        self.branch_codes = np.concatenate([self.branch_codes, np.full(size, -1, dtype=np.int32)])
+        self.publisher_codes = np.concatenate([self.publisher_codes, np.full(size, -1, dtype=np.int32)])
+        self.years = np.concatenate([self.years, np.full(size, np.nan)])
+        self.prices = np.concatenate([self.prices, np.full(size, np.nan)])
+        self.copies = np.concatenate([self.copies, np.zeros(size, dtype=np.int64)])
+        self.borrowed = np.concatenate([self.borrowed, np.zeros(size, dtype=np.int64)])
+        self.alive = np.concatenate([self.alive, np.zeros(size, dtype=bool)])
+        self.membership = np.vstack([self.membership, np.zeros((size, self.membership.shape[1]), dtype=bool)])
+
+    def _write_row(self, index: int, row):
+        self.ids[index] = row.id
+        self.branch_codes[index] = self.branches.encode(row.branch_id)
+        self.publisher_codes[index] = self.publishers.encode(row.publisher)
+        self.years[index] = float("nan") if row.year is None else row.year
+        self.prices[index] = float("nan") if row.price is None else row.price
+        self.copies[index] = row.copies_available or 0
+        self.borrowed[index] = row.students_borrowed_count or 0
+        self.alive[index] = True
+
+    def refresh(self, db: Session, force: bool = False):
+        with self._refresh_lock:
+            if not self.loaded:
+                self._load(db)
+                return
+            if not force and time.monotonic() - self.refreshed_at < self.min_refresh_interval:
+                return
+
+            # Номера seq выдаются в порядке коммитов, поэтому всё до last_seq уже видно целиком
+            pending, last_seq = (
+                db.query(func.count(Change.seq), func.max(Change.seq)).filter(Change.seq > self.last_seq).one()
+            )
+            if not pending:
+                self.refreshed_at = time.monotonic()
+                return
+            if pending > FULL_RELOAD_RATIO * max(len(self.ids), 1):
+                self._load(db)
+                return
+
+            changes = db.execute(
+                select(Change.entity, Change.entity_key).where(Change.seq > self.last_seq, Change.seq <= last_seq)
+            ).all()
+            touched, names = set(), None
+            for entity, key in changes:
+                if entity == "books":
+                    touched.add(int(key))
+                elif entity == "book_faculty":
+                    touched.add(int(key.split(":")[0]))
+                elif entity in ("branches", "faculties"):
+                    names = names or self._names(db)
+
+            book_ids = sorted(touched)
+            rows, links = [], []
+            for chunk in _chunks(book_ids):
+                rows.extend(self._book_rows(db, chunk))
+                links.extend(self._link_rows(db, chunk))
+
+            with self._lock:
+                applied = self._apply(book_ids, rows, links, names)
+                if applied:
+                    self.last_seq = last_seq
+                    self.incremental_refreshes += 1
+                    self.refreshed_at = time.monotonic()
+            if not applied:
+                self._load(db)
+
+    def _apply(self, book_ids: list, rows, links, names) -> bool:
+        np = _numpy()
+        found = {row.id for row in rows}
+        positions = np.searchsorted(self.ids, book_ids)
+        existing = {
+            book_id: int(position)
+            for book_id, position in zip(book_ids, positions)
+            if position < len(self.ids) and self.ids[position] == book_id
+        }
+
+        added = [row for row in rows if row.id not in existing]
+        if added and len(self.ids) and added[0].id <= self.ids[-1]:
+            return False
+
+        if names is not None:
+            self.branch_names, self.faculty_names = names
+        for book_id, index in existing.items():
+            if book_id not in found:
+                self.alive[index] = False
+            self.membership[index] = False
+
+        start = len(self.ids)
+        if added:
+            self._append_rows(added)
+        for offset, row in enumerate(added):
+            existing[row.id] = start + offset
+        for row in rows:
+            self._write_row(existing[row.id], row)
+
+        for link in links:
+            self.faculties.encode(link.faculty_id)
+        self._ensure_faculty_columns()
+        for link in links:
+            self.membership[existing[link.book_id], self.faculties.codes[link.faculty_id]] = True
+        return True
+
+    def _mask(self, branch_id: int = None, faculty_id: int = None):
+        mask = self.alive.copy()
+        if branch_id is not None:
+            mask &= self.branch_codes == self.branches.codes.get(branch_id, -2)
+        if faculty_id is not None:
+            column = self.faculties.codes.get(faculty_id)
+            if column is None:
+                mask[:] = False
+            else:
+                mask &= self.membership[:, column]
+        return mask
+
+    def _metric(self, metric: str):
+        np = _numpy()
+        if metric == "price":
+            return self.prices
+        if metric == "copies":
+            return self.copies.astype(np.float64)
+        if metric == "borrowed":
+            return self.borrowed.astype(np.float64)
+        if metric == "inventory_value":
+            return self.prices * self.copies
+        if metric == "borrow_rate":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(self.copies > 0, self.borrowed / self.copies, np.nan)
+        raise InvalidReportException(f"Недопустимая метрика '{metric}'")
+
+    def _groups(self, group_by: str, mask):
+        np = _numpy()
+        if group_by == "branch":
+            codes, keys = self.branch_codes[mask], self.branches.values
+        elif group_by == "publisher":
+            codes, keys = self.publisher_codes[mask], self.publishers.values
+        elif group_by == "year":
+            years = self.years[mask]
+            known = ~np.isnan(years)
+            keys, inverse = np.unique(years[known], return_inverse=True)
+            codes = np.full(len(years), -1, dtype=np.int64)
+            codes[known] = inverse
+            keys = [int(year) for year in keys]
+        else:
+            raise InvalidReportException(f"Недопустимая группировка '{group_by}'")
+        return codes + 1, [None] + list(keys)
+
+    def inventory(self, group_by: str, branch_id: int = None, faculty_id: int = None, limit: int = None) -> dict:
+        np = _numpy()
+        with self._lock:
+            mask = self._mask(branch_id, faculty_id)
+            prices, copies = self.prices[mask], self.copies[mask]
+            priced = ~np.isnan(prices)
+            values = np.where(priced, prices * copies, 0.0)
+
+            if group_by == "faculty":
+                membership = self.membership[mask]
+                keys = self.faculties.values
+                books = membership.sum(axis=0)
+                total_copies = copies @ membership
+                total_values = values @ membership
+                price_sums = np.where(priced, prices, 0.0) @ membership
+                priced_counts = priced.astype(np.int64) @ membership
+            else:
+                codes, keys = self._groups(group_by, mask)
+                size = len(keys)
+                books = np.bincount(codes, minlength=size)
+                total_copies = np.bincount(codes, weights=copies, minlength=size)
+                total_values = np.bincount(codes, weights=values, minlength=size)
+                price_sums = np.bincount(codes, weights=np.where(priced, prices, 0.0), minlength=size)
+                priced_counts = np.bincount(codes, weights=priced, minlength=size)
+
+            names = {"branch": self.branch_names, "faculty": self.faculty_names}.get(group_by, {})
+            order = [index for index in np.lexsort((np.arange(len(keys)), -total_values)) if books[index]]
+            if limit is not None:
+                order = order[:limit]
+
+            return {
+                "group_by": group_by,
+                "total_books": int(mask.sum()),
+                "groups": [
+                    {
+                        "key": keys[index],
+                        "name": names.get(keys[index]),
+                        "books": int(books[index]),
+                        "copies": int(total_copies[index]),
+                        "inventory_value": round(float(total_values[index]), 2),
+                        "avg_price": (
+                            round(float(price_sums[index] / priced_counts[index]), 2) if priced_counts[index] else None
+                        ),
+                    }
+                    for index in order
+                ],
+            }
+
+    def distribution(
+        self,
+        metric: str,
+        percentiles=(25, 50, 75, 90, 99),
+        bins: int = 10,
+        branch_id: int = None,
+        faculty_id: int = None,
+    ) -> dict:
+        np = _numpy()
+        with self._lock:
+            values = self._metric(metric)[self._mask(branch_id, faculty_id)]
+            values = values[~np.isnan(values)]
+            if not len(values):
+                return {"metric": metric, "count": 0, "percentiles": {}, "histogram": []}
+
+            counts, edges = np.histogram(values, bins=bins)
+            return {
+                "metric": metric,
+                "count": int(len(values)),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                "mean": float(values.mean()),
+                "percentiles": {
+                    f"{percentile:g}": float(value)
+                    for percentile, value in zip(percentiles, np.percentile(values, percentiles))
+                },
+                "histogram": [
+                    {"low": float(edges[index]), "high": float(edges[index + 1]), "count": int(count)}
+                    for index, count in enumerate(counts)
+                ],
+            }
+
+    def top_books(self, metric: str, n: int = 10, branch_id: int = None, faculty_id: int = None) -> dict:
+        np = _numpy()
+        with self._lock:
+            values = self._metric(metric)
+            candidates = np.flatnonzero(self._mask(branch_id, faculty_id) & ~np.isnan(values))
+            if len(candidates) > n:
+                candidates = candidates[np.argpartition(-values[candidates], n - 1)[:n]]
+            order = candidates[np.lexsort((self.ids[candidates], -values[candidates]))]
+            return {
+                "metric": metric,
+                "books": [{"book_id": int(self.ids[index]), "value": float(values[index])} for index in order],
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            if not self.loaded:
+                return {"loaded": False}
+            arrays = (
+                self.ids,
+                self.branch_codes,
+                self.publisher_codes,
+                self.years,
+                self.prices,
+                self.copies,
+                self.borrowed,
+                self.alive,
+                self.membership,
+            )
+            return {
+                "loaded": True,
+                "rows": int(self.alive.sum()),
+                "last_seq": self.last_seq,
+                "full_loads": self.full_loads,
+                "incremental_refreshes": self.incremental_refreshes,
+                "array_bytes": sum(array.nbytes for array in arrays),
+            }
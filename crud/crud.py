@@ -1,20 +1,245 @@
-from sqlalchemy.orm import Session
-from models.models import Book, Branch, Faculty
-from schemas.schemas import BookCreate, BookUpdate, BranchCreate, FacultyCreate
+import weakref
+from collections import defaultdict
+from functools import cmp_to_key
+
+from sqlalchemy import delete, event, exists, func, insert, or_, select, true, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, load_only, selectinload
+from models.models import Book, Branch, Change, Faculty, Work, book_faculty
+from schemas.schemas import (
+    BOOK_FIELDS,
+    BookBulkDelete,
+    BookBulkUpdate,
+    BookCreate,
+    BookFilter,
+    BookUpdate,
+    BranchCreate,
+    FacultyAssignment,
+    FacultyCreate,
+    book_response_model,
+)
 from exceptions.exceptions import (
     BranchNotFoundException,
     DuplicateBookException,
     FacultyNotFoundException,
     BookNotFoundException,
+    InvalidBookDataException,
 )
 
 
-def get_book(db: Session, book_id: int):
-    return db.query(Book).filter(Book.id == book_id).first()
+CHANGE_ENTITIES = {
+    "books": Book,
+    "branches": Branch,
+    "faculties": Faculty,
+}
+
+
+CHANGE_LOG_LOCK = 0x6368616E676573
+
+
+change_listeners = []
+_pending_changes = weakref.WeakKeyDictionary()
+
+
+def _commit(db: Session):
+    db.commit()
+    for listener in change_listeners:
+        listener(db)
+
+
+def _link_key(book_id, faculty_id):
+    return f"{book_id}:{faculty_id}"
+
+
+def _record_changes(db: Session, entity: str, op: str, keys):
+    _pending_changes.setdefault(db, []).extend({"entity": entity, "entity_key": str(key), "op": op} for key in keys)
+
+
+def _record_book_changes(db: Session, op: str, clauses):
+    _record_changes(db, "books", op, db.scalars(select(Book.id).where(*clauses)))
+
+
+def _record_link_changes(db: Session, op: str, links):
+    links = links.subquery()
+    rows = db.execute(select(links.c.book_id, links.c.faculty_id))
+    _record_changes(db, "book_faculty", op, [_link_key(book_id, faculty_id) for book_id, faculty_id in rows])
+
+
+@event.listens_for(Session, "before_commit")
+def _write_changes(db: Session):
+    # Номера seq выдаются прямо перед коммитом под блокировкой журнала, поэтому их порядок совпадает
+    # с порядком коммитов: читатель, видящий seq N, уже видит все меньшие номера.
+    # В SQLite пишущая транзакция и так держит блокировку базы до коммита
+    rows = _pending_changes.pop(db, None)
+    if rows:
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+        db.execute(insert(Change), rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(db: Session):
+    _pending_changes.pop(db, None)
+
+
+def _change_data(entity: str, key: str, row):
+    if entity == "book_faculty":
+        book_id, faculty_id = key.split(":")
+        return {"book_id": int(book_id), "faculty_id": int(faculty_id)}
+    return _row_values(row)
+
+
+def _row_values(row):
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+
+def get_changes(db: Session, since: int = 0, limit: int = 100):
+    changes = db.query(Change).filter(Change.seq > since).order_by(Change.seq).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    latest = {}
+    for change in changes:
+        latest.pop((change.entity, change.entity_key), None)
+        latest[(change.entity, change.entity_key)] = change
+
+    rows = {}
+    for entity, model in CHANGE_ENTITIES.items():
+        ids = [int(key) for (name, key), change in latest.items() if name == entity and change.op != "delete"]
+        if ids:
+            rows.update({(entity, str(row.id)): row for row in db.query(model).filter(model.id.in_(ids))})
 
+    records = []
+    for (entity, key), change in latest.items():
+        op = change.op
+        if entity in CHANGE_ENTITIES and (entity, key) not in rows:
+            op = "delete"
+        records.append(
+            {
+                "seq": change.seq,
+                "entity": entity,
+                "key": key,
+                "op": op,
+                "changed_at": change.changed_at,
+                "data": None if op == "delete" else _change_data(entity, key, rows.get((entity, key))),
+            }
+        )
 
-def get_books(db: Session):
-    return db.query(Book).all()
+    return {
+        "changes": records,
+        "next_token": changes[-1].seq if changes else since,
+        "has_more": has_more,
+    }
+
+
+def parse_book_fieldset(fields: str = None, expand: str = None):
+    expanded = {name.strip() for name in expand.split(",") if name.strip()} if expand else set()
+    unknown = expanded - {"faculties"}
+    if unknown:
+        raise InvalidBookDataException(f"Недопустимые значения expand: {', '.join(sorted(unknown))}")
+
+    if fields is None:
+        return None, expand is None or "faculties" in expanded
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(BOOK_FIELDS)
+    if unknown:
+        raise InvalidBookDataException(f"Недопустимые поля: {', '.join(sorted(unknown))}")
+
+    return tuple(name for name in BOOK_FIELDS if name in requested or name == "id"), "faculties" in expanded
+
+
+def _book_options(fields, expand_faculties: bool):
+    options = []
+    if fields is not None:
+        options.append(load_only(*(getattr(Book, name) for name in fields)))
+        if expand_faculties:
+            options.append(selectinload(Book.faculties))
+    return options
+
+
+def get_book(db: Session, book_id: int, fields=None, expand_faculties: bool = True):
+    query = db.query(Book)
+    options = _book_options(fields, expand_faculties)
+    if options:
+        query = query.options(*options)
+    return query.filter(Book.id == book_id).first()
+
+
+BOOK_SORT_KEYS = {
+    "id": Book.id,
+    "title": Book.title,
+    "author": Book.author,
+    "publisher": Book.publisher,
+    "year": Book.year,
+    "price": Book.price,
+    "copies_available": Book.copies_available,
+}
+
+
+def _book_order(sort: str):
+    order = []
+    for key in sort.split(","):
+        column = BOOK_SORT_KEYS.get(key.lstrip("-"))
+        if column is None:
+            raise InvalidBookDataException(f"Недопустимый ключ сортировки '{key}'")
+        order.append(column.desc() if key.startswith("-") else column.asc())
+    order.append(Book.id.asc())
+    return order
+
+
+def books_query(
+    db: Session,
+    book_filter: BookFilter = None,
+    sort: str = None,
+    skip: int = 0,
+    limit: int = None,
+    fields=None,
+    expand_faculties: bool = True,
+):
+    query = db.query(Book)
+
+    options = _book_options(fields, expand_faculties)
+    if options:
+        query = query.options(*options)
+
+    clauses = _book_filter_clauses(book_filter) if book_filter else []
+    if clauses:
+        query = query.filter(*clauses)
+
+    if sort:
+        query = query.order_by(*_book_order(sort))
+    elif skip or limit is not None:
+        query = query.order_by(Book.id)
+
+    if skip:
+        query = query.offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query
+
+
+def get_books(
+    db: Session,
+    book_filter: BookFilter = None,
+    sort: str = None,
+    skip: int = 0,
+    limit: int = None,
+    fields=None,
+    expand_faculties: bool = True,
+):
+    return books_query(db, book_filter, sort, skip, limit, fields, expand_faculties).all()
+
+
+def _get_or_create_work(db: Session, title: str, author: str):
+    return _ensure_works(db, [(title, author)], _upsert_insert(db))[(title, author)]
+
+
+def _prune_works(db: Session, work_ids):
+    work_ids = [work_id for work_id in work_ids if work_id is not None]
+    if work_ids:
+        db.execute(delete(Work).where(Work.id.in_(work_ids), ~exists().where(Book.work_id == Work.id)))
 
 
 def create_book(db: Session, book: BookCreate):
@@ -52,8 +277,13 @@ def create_book(db: Session, book: BookCreate):
             raise FacultyNotFoundException("Один или несколько факультетов не найдены")
         db_book.faculties = faculties
 
+    db_book.work_id = _get_or_create_work(db, book.title, book.author)
+
     db.add(db_book)
-    db.commit()
+    db.flush()
+    _record_changes(db, "books", "insert", [db_book.id])
+    _record_changes(db, "book_faculty", "insert", [_link_key(db_book.id, faculty.id) for faculty in db_book.faculties])
+    _commit(db)
     db.refresh(db_book)
 
     return db_book
@@ -67,17 +297,44 @@ def update_book(db: Session, book_id: int, book: BookUpdate):
 
     update_data = book.model_dump(exclude_unset=True)
 
+    key = {field: update_data.get(field, getattr(db_book, field)) for field in ("title", "author", "branch_id")}
+    if key != {field: getattr(db_book, field) for field in key}:
+        duplicate = db.query(Book.id).filter(
+            Book.title == key["title"],
+            Book.author == key["author"],
+            Book.branch_id == key["branch_id"],
+            Book.id != book_id,
+        )
+        if duplicate.first():
+            raise DuplicateBookException(f"Книга '{key['title']}' уже существует в этом филиале")
+
     if "faculty_ids" in update_data:
         faculties = db.query(Faculty).filter(Faculty.id.in_(update_data["faculty_ids"])).all()
         if len(faculties) != len(update_data["faculty_ids"]):
             raise FacultyNotFoundException("Один или несколько факультетов не найдены")
+        old_ids = {faculty.id for faculty in db_book.faculties}
+        new_ids = {faculty.id for faculty in faculties}
+        _record_changes(
+            db, "book_faculty", "delete", [_link_key(book_id, faculty_id) for faculty_id in old_ids - new_ids]
+        )
+        _record_changes(
+            db, "book_faculty", "insert", [_link_key(book_id, faculty_id) for faculty_id in new_ids - old_ids]
+        )
         db_book.faculties = faculties
         del update_data["faculty_ids"]
 
     for field, value in update_data.items():
         setattr(db_book, field, value)
 
-    db.commit()
+    old_work_id = db_book.work_id
+    if "title" in update_data or "author" in update_data:
+        db_book.work_id = _get_or_create_work(db, db_book.title, db_book.author)
+
+    _record_changes(db, "books", "update", [book_id])
+    if db_book.work_id != old_work_id:
+        db.flush()
+        _prune_works(db, [old_work_id])
+    _commit(db)
     db.refresh(db_book)
 
     return db_book
@@ -89,8 +346,12 @@ def delete_book(db: Session, book_id: int):
     if not db_book:
         raise BookNotFoundException(f"Книга с ID {book_id} не найдена")
 
+    _record_link_changes(db, "delete", select(book_faculty).where(book_faculty.c.book_id == book_id))
+    _record_changes(db, "books", "delete", [book_id])
     db.delete(db_book)
-    db.commit()
+    db.flush()
+    _prune_works(db, [db_book.work_id])
+    _commit(db)
 
     return db_book
 
@@ -107,7 +368,9 @@ def create_branch(db: Session, branch: BranchCreate):
     db_branch = Branch(**branch.model_dump())
 
     db.add(db_branch)
-    db.commit()
+    db.flush()
+    _record_changes(db, "branches", "insert", [db_branch.id])
+    _commit(db)
     db.refresh(db_branch)
 
     return db_branch
@@ -121,7 +384,8 @@ def update_branch(db: Session, branch_id: int, branch: BranchCreate):
     for field, value in branch.model_dump().items():
         setattr(db_branch, field, value)
 
-    db.commit()
+    _record_changes(db, "branches", "update", [branch_id])
+    _commit(db)
     db.refresh(db_branch)
     return db_branch
 
@@ -129,15 +393,102 @@ def update_branch(db: Session, branch_id: int, branch: BranchCreate):
 def create_faculty(db: Session, faculty: FacultyCreate):
     db_faculty = Faculty(**faculty.model_dump())
     db.add(db_faculty)
-    db.commit()
+    db.flush()
+    _record_changes(db, "faculties", "insert", [db_faculty.id])
+    _commit(db)
     db.refresh(db_faculty)
     return db_faculty
 
 
+def get_faculty(db: Session, faculty_id: int):
+    return db.query(Faculty).filter(Faculty.id == faculty_id).first()
+
+
 def get_faculties(db: Session):
     return db.query(Faculty).all()
 
 
+def get_faculty_books(db: Session, faculty_id: int, branch_id: int = None, skip: int = 0, limit: int = 100):
+    faculty = get_faculty(db, faculty_id)
+    if not faculty:
+        raise FacultyNotFoundException(f"Факультет с ID {faculty_id} не найден")
+
+    query = (
+        db.query(
+            Book.id,
+            Book.title,
+            Book.author,
+            Book.branch_id,
+            Branch.name.label("branch_name"),
+            Book.copies_available,
+            func.count().over().label("total_books"),
+            func.coalesce(func.sum(Book.copies_available).over(), 0).label("total_copies"),
+        )
+        .join(book_faculty, book_faculty.c.book_id == Book.id)
+        .outerjoin(Branch, Branch.id == Book.branch_id)
+        .filter(book_faculty.c.faculty_id == faculty_id)
+    )
+    if branch_id is not None:
+        query = query.filter(Book.branch_id == branch_id)
+
+    rows = query.order_by(Book.title, Book.id).offset(skip).limit(limit).all()
+    books = [
+        {key: value for key, value in row._asdict().items() if key not in ("total_books", "total_copies")}
+        for row in rows
+    ]
+
+    if rows:
+        total_books, total_copies = rows[0].total_books, rows[0].total_copies
+    else:
+        totals = query.with_entities(func.count(Book.id), func.coalesce(func.sum(Book.copies_available), 0)).one()
+        total_books, total_copies = totals
+
+    return {
+        "faculty_id": faculty.id,
+        "faculty_name": faculty.name,
+        "total_books": total_books,
+        "total_copies": total_copies,
+        "books": books,
+    }
+
+
+def get_works(db: Session, title: str = None, author: str = None):
+    query = db.query(Work)
+    if title is not None:
+        query = query.filter(Work.title == title)
+    if author is not None:
+        query = query.filter(Work.author == author)
+    return query.order_by(Work.title, Work.author).all()
+
+
+def get_work_availability(db: Session, work_id: int):
+    work = db.query(Work).filter(Work.id == work_id).first()
+    if not work:
+        raise BookNotFoundException(f"Произведение с ID {work_id} не найдено")
+
+    holdings = (
+        db.query(
+            Book.id.label("book_id"),
+            Book.branch_id,
+            Branch.name.label("branch_name"),
+            Book.copies_available,
+            Book.students_borrowed_count,
+        )
+        .outerjoin(Branch, Branch.id == Book.branch_id)
+        .filter(Book.work_id == work_id)
+        .order_by(Book.branch_id)
+        .all()
+    )
+
+    return {
+        "id": work.id,
+        "title": work.title,
+        "author": work.author,
+        "total_copies": sum(holding.copies_available or 0 for holding in holdings),
+        "holdings": [holding._asdict() for holding in holdings],
+    }
+
+
 def get_book_copies_in_branch(db: Session, branch_name: str, book_title: str):
     branch = db.query(Branch).filter(Branch.name == branch_name).first()
     if not branch:
@@ -169,3 +520,525 @@ def get_book_faculties_in_branch(db: Session, book_title: str, branch_name: str)
         "faculties_count": len(faculties),
         "faculties": faculties,
     }
+
+
+def _book_filter_clauses(book_filter: BookFilter):
+    clauses = []
+    if book_filter.branch_id is not None:
+        clauses.append(Book.branch_id == book_filter.branch_id)
+    if book_filter.author is not None:
+        clauses.append(Book.author == book_filter.author)
+    if book_filter.publisher is not None:
+        clauses.append(Book.publisher == book_filter.publisher)
+    if book_filter.title_pattern is not None:
+        clauses.append(Book.title.like(book_filter.title_pattern))
+    if book_filter.year_min is not None:
+        clauses.append(Book.year >= book_filter.year_min)
+    if book_filter.year_max is not None:
+        clauses.append(Book.year <= book_filter.year_max)
+    if book_filter.price_min is not None:
+        clauses.append(Book.price >= book_filter.price_min)
+    if book_filter.price_max is not None:
+        clauses.append(Book.price <= book_filter.price_max)
+    if book_filter.in_stock is not None:
+        clauses.append(Book.copies_available > 0 if book_filter.in_stock else Book.copies_available <= 0)
+    if book_filter.faculty_id is not None:
+        clauses.append(
+            Book.id.in_(select(book_faculty.c.book_id).where(book_faculty.c.faculty_id == book_filter.faculty_id))
+        )
+    return clauses
+
+
+def _book_selection_clauses(assignment: FacultyAssignment):
+    clauses = []
+    if assignment.book_ids is not None:
+        clauses.append(Book.id.in_(assignment.book_ids))
+    if assignment.filter is not None:
+        clauses.extend(_book_filter_clauses(assignment.filter))
+
+    if not clauses:
+        raise InvalidBookDataException("Не задан набор книг: укажите book_ids или filter")
+
+    return clauses
+
+
+def _check_faculties_exist(db: Session, faculty_ids):
+    found = db.query(func.count(Faculty.id)).filter(Faculty.id.in_(faculty_ids)).scalar()
+    if found != len(faculty_ids):
+        raise FacultyNotFoundException("Один или несколько факультетов не найдены")
+
+
+def assign_faculties(db: Session, assignment: FacultyAssignment):
+    faculty_ids = sorted(set(assignment.faculty_ids))
+    clauses = _book_selection_clauses(assignment)
+    _check_faculties_exist(db, faculty_ids)
+
+    existing_link = exists().where(
+        book_faculty.c.book_id == Book.id,
+        book_faculty.c.faculty_id == Faculty.id,
+    )
+    missing_links = (
+        select(Book.id, Faculty.id)
+        .join_from(Book, Faculty, true())
+        .where(*clauses, Faculty.id.in_(faculty_ids), ~existing_link)
+    )
+
+    _record_link_changes(
+        db, "insert", missing_links.with_only_columns(Book.id.label("book_id"), Faculty.id.label("faculty_id"))
+    )
+    # NOT EXISTS отсекает известные связи, а уникальный индекс пропускает вставленные параллельной транзакцией
+    result = db.execute(
+        _upsert_insert(db)(book_faculty).from_select(["book_id", "faculty_id"], missing_links).on_conflict_do_nothing()
+    )
+    _commit(db)
+
+    return {"faculty_ids": faculty_ids, "affected": result.rowcount}
+
+
+def remove_faculties(db: Session, assignment: FacultyAssignment):
+    faculty_ids = sorted(set(assignment.faculty_ids))
+    clauses = _book_selection_clauses(assignment)
+    _check_faculties_exist(db, faculty_ids)
+
+    link_clauses = (
+        book_faculty.c.faculty_id.in_(faculty_ids),
+        book_faculty.c.book_id.in_(select(Book.id).where(*clauses)),
+    )
+    _record_link_changes(db, "delete", select(book_faculty).where(*link_clauses))
+    result = db.execute(delete(book_faculty).where(*link_clauses))
+    _commit(db)
+
+    return {"faculty_ids": faculty_ids, "affected": result.rowcount}
+
+
+def _bulk_filter_clauses(book_filter: BookFilter):
+    clauses = _book_filter_clauses(book_filter)
+    if not clauses:
+        raise InvalidBookDataException("Пустой фильтр: массовая операция над всеми книгами запрещена")
+    return clauses
+
+
+def count_books(db: Session, clauses):
+    return db.query(func.count(Book.id)).filter(*clauses).scalar()
+
+
+def _check_move_duplicates(db: Session, clauses, branch_id: int):
+    moved = select(Book.title, Book.author).where(*clauses)
+    collides_with_target = db.query(
+        exists().where(
+            Book.branch_id == branch_id,
+            tuple_(Book.title, Book.author).in_(moved),
+            Book.id.not_in(select(Book.id).where(*clauses)),
+        )
+    ).scalar()
+    repeated = moved.group_by(Book.title, Book.author).having(func.count() > 1)
+    collides_within_selection = db.query(repeated.exists()).scalar()
+    if collides_with_target or collides_within_selection:
+        raise DuplicateBookException(f"Перенос создаст дубликаты книг в филиале с ID {branch_id}")
+
+
+def update_books(db: Session, bulk: BookBulkUpdate):
+    clauses = _bulk_filter_clauses(bulk.filter)
+    values = bulk.changes.model_dump(exclude_unset=True)
+
+    price_factor = values.pop("price_factor", None)
+    if price_factor is not None:
+        if "price" in values:
+            raise InvalidBookDataException("Нельзя одновременно задать price и price_factor")
+        values["price"] = Book.price * price_factor
+
+    if not values:
+        raise InvalidBookDataException("Не заданы изменения")
+
+    if "branch_id" in values:
+        if not get_branch(db, values["branch_id"]):
+            raise BranchNotFoundException(f"Филиал с ID {values['branch_id']} не найден")
+        _check_move_duplicates(db, clauses, values["branch_id"])
+
+    if bulk.dry_run:
+        return {"affected": count_books(db, clauses), "dry_run": True}
+
+    _record_book_changes(db, "update", clauses)
+    result = db.execute(update(Book).where(*clauses).values(**values).execution_options(synchronize_session=False))
+    _commit(db)
+
+    return {"affected": result.rowcount, "dry_run": False}
+
+
+def delete_books(db: Session, bulk: BookBulkDelete):
+    clauses = _bulk_filter_clauses(bulk.filter)
+
+    if bulk.dry_run:
+        return {"affected": count_books(db, clauses), "dry_run": True}
+
+    book_ids = select(Book.id).where(*clauses)
+    if bulk.filter.faculty_id is not None:
+        # Фильтр по факультету читает book_faculty, поэтому набор книг фиксируется до удаления связей
+        book_ids = db.scalars(book_ids).all()
+
+    work_ids = db.scalars(select(Book.work_id).where(Book.id.in_(book_ids)).distinct()).all()
+    _record_link_changes(db, "delete", select(book_faculty).where(book_faculty.c.book_id.in_(book_ids)))
+    _record_book_changes(db, "delete", [Book.id.in_(book_ids)])
+    db.execute(delete(book_faculty).where(book_faculty.c.book_id.in_(book_ids)))
+    result = db.execute(delete(Book).where(Book.id.in_(book_ids)).execution_options(synchronize_session=False))
+    for chunk in _chunks(work_ids):
+        _prune_works(db, chunk)
+    _commit(db)
+
+    return {"affected": result.rowcount, "dry_run": False}
+
+
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+UPSERT_COLUMNS = (
+    "publisher",
+    "year",
+    "pages",
+    "illustrations",
+    "price",
+    "copies_available",
+    "students_borrowed_count",
+    "work_id",
+)
+UPSERT_CHUNK_SIZE = 500
+
+
+def _chunks(items: list):
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        end = start + UPSERT_CHUNK_SIZE
+        yield items[start:end]
+
+
+def _upsert_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect not in UPSERT_INSERTS:
+        raise InvalidBookDataException(f"Upsert не поддерживается для СУБД '{dialect}'")
+    return UPSERT_INSERTS[dialect]
+
+
+def _ensure_works(db: Session, pairs, upsert_insert):
+    pairs = list(dict.fromkeys(pairs))
+    for chunk in _chunks(pairs):
+        db.execute(
+            upsert_insert(Work)
+            .values([{"title": title, "author": author} for title, author in chunk])
+            .on_conflict_do_nothing(index_elements=["title", "author"])
+        )
+
+    works = {}
+    for chunk in _chunks(pairs):
+        rows = db.execute(select(Work.id, Work.title, Work.author).where(tuple_(Work.title, Work.author).in_(chunk)))
+        works.update({(row.title, row.author): row.id for row in rows})
+    return works
+
+
+def _reconcile_faculties(db: Session, desired: dict):
+    if not desired:
+        return set()
+
+    current = set(
+        db.execute(
+            select(book_faculty.c.book_id, book_faculty.c.faculty_id).where(book_faculty.c.book_id.in_(list(desired)))
+        ).all()
+    )
+    wanted = {(book_id, faculty_id) for book_id, faculty_ids in desired.items() for faculty_id in faculty_ids}
+
+    removed = current - wanted
+    added = wanted - current
+    _record_changes(db, "book_faculty", "delete", [_link_key(*link) for link in removed])
+    _record_changes(db, "book_faculty", "insert", [_link_key(*link) for link in added])
+    if removed:
+        db.execute(delete(book_faculty).where(tuple_(book_faculty.c.book_id, book_faculty.c.faculty_id).in_(removed)))
+    if added:
+        db.execute(
+            insert(book_faculty), [{"book_id": book_id, "faculty_id": faculty_id} for book_id, faculty_id in added]
+        )
+
+    return {book_id for book_id, _ in removed | added}
+
+
+def upsert_books(db: Session, books):
+    records = list({(book.title, book.author, book.branch_id): book for book in books}.values())
+    if not records:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "book_ids": []}
+
+    branch_ids = {record.branch_id for record in records}
+    if db.query(func.count(Branch.id)).filter(Branch.id.in_(branch_ids)).scalar() != len(branch_ids):
+        raise BranchNotFoundException("Один или несколько филиалов не найдены")
+
+    faculty_ids = {faculty_id for record in records for faculty_id in record.faculty_ids or []}
+    if faculty_ids:
+        _check_faculties_exist(db, faculty_ids)
+
+    upsert_insert = _upsert_insert(db)
+    works = _ensure_works(db, [(record.title, record.author) for record in records], upsert_insert)
+    keys = [(record.title, record.author, record.branch_id) for record in records]
+
+    existing = set()
+    for chunk in _chunks(keys):
+        existing.update(
+            db.execute(
+                select(Book.title, Book.author, Book.branch_id).where(
+                    tuple_(Book.title, Book.author, Book.branch_id).in_(chunk)
+                )
+            ).all()
+        )
+
+    changed = {}
+    for chunk in _chunks(records):
+        statement = upsert_insert(Book).values(
+            [
+                {**record.model_dump(exclude={"faculty_ids"}), "work_id": works[(record.title, record.author)]}
+                for record in chunk
+            ]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["title", "author", "branch_id"],
+            set_={**{column: statement.excluded[column] for column in UPSERT_COLUMNS}, "updated_at": func.now()},
+            where=or_(
+                *(Book.__table__.c[column].is_distinct_from(statement.excluded[column]) for column in UPSERT_COLUMNS)
+            ),
+        ).returning(Book.id, Book.title, Book.author, Book.branch_id)
+        changed.update({(row.title, row.author, row.branch_id): row.id for row in db.execute(statement)})
+
+    unchanged_keys = [key for key in keys if key not in changed]
+    book_ids = dict(changed)
+    for chunk in _chunks(unchanged_keys):
+        rows = db.execute(
+            select(Book.id, Book.title, Book.author, Book.branch_id).where(
+                tuple_(Book.title, Book.author, Book.branch_id).in_(chunk)
+            )
+        )
+        book_ids.update({(row.title, row.author, row.branch_id): row.id for row in rows})
+
+    relinked = _reconcile_faculties(
+        db,
+        {
+            book_ids[key]: set(record.faculty_ids)
+            for key, record in zip(keys, records)
+            if record.faculty_ids is not None
+        },
+    )
+    inserted = [key for key in changed if key not in existing]
+    updated = [key for key in keys if key in existing and (key in changed or book_ids[key] in relinked)]
+
+    _record_changes(db, "books", "insert", [book_ids[key] for key in inserted])
+    _record_changes(db, "books", "update", [book_ids[key] for key in updated if key in changed])
+    _commit(db)
+
+    return {
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "unchanged": len(keys) - len(inserted) - len(updated),
+        "book_ids": [book_ids[key] for key in keys],
+    }
+
+
+def _shards_for_filter(shards, book_filter: BookFilter = None):
+    if book_filter is not None and book_filter.branch_id is not None:
+        return [shards.shard_for_branch(book_filter.branch_id)]
+    return shards.shards
+
+
+def _book_shard(shards, book_id: int):
+    shard = shards.shard_for_book(book_id)
+    if shard is None:
+        raise BookNotFoundException(f"Книга с ID {book_id} не найдена")
+    return shard
+
+
+def _branch_shard(shards, branch_name: str):
+    branch = shards.call(shards.home, lambda db: db.query(Branch.id).filter(Branch.name == branch_name).first())
+    if not branch:
+        raise BranchNotFoundException(f"Филиал '{branch_name}' не найден")
+    return shards.shard_for_branch(branch.id)
+
+
+def _replicate(shards, model, values: dict):
+    def copy(db: Session):
+        db.merge(model(**values))
+        db.commit()
+
+    shards.scatter(copy, shards.shards[1:])
+
+
+def _total(results, key: str) -> int:
+    return sum(result[key] for result in results)
+
+
+def _merge_key(sort: str, nulls_first: bool):
+    descending = [key.startswith("-") for key in sort.split(",")] if sort else []
+    descending.append(False)
+
+    def compare(left, right):
+        for reverse, left_value, right_value in zip(descending, left, right):
+            if left_value == right_value:
+                continue
+            if left_value is None or right_value is None:
+                result = -1 if (left_value is None) == nulls_first else 1
+            else:
+                result = -1 if left_value < right_value else 1
+            return -result if reverse else result
+        return 0
+
+    return cmp_to_key(compare)
+
+
+def sharded_create_branch(shards, branch: BranchCreate):
+    db_branch = shards.call(shards.home, lambda db: create_branch(db, branch))
+    _replicate(shards, Branch, _row_values(db_branch))
+    return db_branch
+
+
+def sharded_update_branch(shards, branch_id: int, branch: BranchCreate):
+    db_branch = shards.call(shards.home, lambda db: update_branch(db, branch_id, branch))
+    _replicate(shards, Branch, _row_values(db_branch))
+    return db_branch
+
+
+def sharded_create_faculty(shards, faculty: FacultyCreate):
+    db_faculty = shards.call(shards.home, lambda db: create_faculty(db, faculty))
+    _replicate(shards, Faculty, _row_values(db_faculty))
+    return db_faculty
+
+
+def sharded_get_book(shards, book_id: int, fields=None, expand_faculties: bool = True):
+    shard = shards.shard_for_book(book_id)
+    if shard is None:
+        return None
+
+    model = book_response_model(fields, expand_faculties)
+
+    def load(db: Session):
+        db_book = get_book(db, book_id, fields, expand_faculties)
+        return model.model_validate(db_book) if db_book else None
+
+    return shards.call(shard, load)
+
+
+def sharded_get_books(
+    shards,
+    book_filter: BookFilter = None,
+    sort: str = None,
+    skip: int = 0,
+    limit: int = None,
+    fields=None,
+    expand_faculties: bool = True,
+):
+    model = book_response_model(fields, expand_faculties)
+    sort_columns = [clause.element.key for clause in _book_order(sort)] if sort else ["id"]
+    if fields is not None:
+        fields = tuple(dict.fromkeys((*fields, *sort_columns)))
+
+    shard_limit = None if limit is None else skip + limit
+
+    def fetch(db: Session):
+        query = books_query(db, book_filter, sort, 0, shard_limit, fields, expand_faculties)
+        if fields is None and expand_faculties:
+            query = query.options(selectinload(Book.faculties))
+        return [(tuple(getattr(book, column) for column in sort_columns), model.model_validate(book)) for book in query]
+
+    merge_key = _merge_key(sort, shards.home.nulls_first)
+    rows = [row for rows in shards.scatter(fetch, _shards_for_filter(shards, book_filter)) for row in rows]
+    rows.sort(key=lambda row: merge_key(row[0]))
+    return [book for _, book in rows[skip:shard_limit]]
+
+
+def sharded_create_book(shards, book: BookCreate):
+    model = book_response_model(None, True)
+    return shards.call(shards.shard_for_branch(book.branch_id), lambda db: model.model_validate(create_book(db, book)))
+
+
+def sharded_update_book(shards, book_id: int, book: BookUpdate):
+    shard = _book_shard(shards, book_id)
+    if "branch_id" in book.model_fields_set and shards.shard_for_branch(book.branch_id) is not shard:
+        raise InvalidBookDataException("Перенос книги в филиал другого шарда не поддерживается")
+
+    model = book_response_model(None, True)
+    return shards.call(shard, lambda db: model.model_validate(update_book(db, book_id, book)))
+
+
+def sharded_delete_book(shards, book_id: int):
+    model = book_response_model(None, False)
+    return shards.call(_book_shard(shards, book_id), lambda db: model.model_validate(delete_book(db, book_id)))
+
+
+def sharded_get_book_copies_in_branch(shards, branch_name: str, book_title: str):
+    shard = _branch_shard(shards, branch_name)
+    return shards.call(shard, lambda db: get_book_copies_in_branch(db, branch_name, book_title))
+
+
+def sharded_get_book_faculties_in_branch(shards, book_title: str, branch_name: str):
+    shard = _branch_shard(shards, branch_name)
+    return shards.call(shard, lambda db: get_book_faculties_in_branch(db, book_title, branch_name))
+
+
+def sharded_get_faculty_books(shards, faculty_id: int, branch_id: int = None, skip: int = 0, limit: int = 100):
+    targets = shards.shards if branch_id is None else [shards.shard_for_branch(branch_id)]
+    pages = shards.scatter(lambda db: get_faculty_books(db, faculty_id, branch_id, 0, skip + limit), targets)
+    books = sorted((book for page in pages for book in page["books"]), key=lambda book: (book["title"], book["id"]))
+
+    return {
+        "faculty_id": pages[0]["faculty_id"],
+        "faculty_name": pages[0]["faculty_name"],
+        "total_books": _total(pages, "total_books"),
+        "total_copies": _total(pages, "total_copies"),
+        "books": books[skip:][:limit],
+    }
+
+
+def _assignment_shards(shards, assignment: FacultyAssignment):
+    if assignment.filter is not None and assignment.filter.branch_id is not None:
+        return _shards_for_filter(shards, assignment.filter)
+    if assignment.filter is None and assignment.book_ids is not None:
+        targets = {shards.shard_for_book(book_id) for book_id in assignment.book_ids} - {None}
+        return sorted(targets, key=lambda shard: shard.index)
+    return shards.shards
+
+
+def sharded_assign_faculties(shards, assignment: FacultyAssignment):
+    _book_selection_clauses(assignment)
+    results = shards.scatter(lambda db: assign_faculties(db, assignment), _assignment_shards(shards, assignment))
+    return {"faculty_ids": sorted(set(assignment.faculty_ids)), "affected": _total(results, "affected")}
+
+
+def sharded_remove_faculties(shards, assignment: FacultyAssignment):
+    _book_selection_clauses(assignment)
+    results = shards.scatter(lambda db: remove_faculties(db, assignment), _assignment_shards(shards, assignment))
+    return {"faculty_ids": sorted(set(assignment.faculty_ids)), "affected": _total(results, "affected")}
+
+
+def sharded_update_books(shards, bulk: BookBulkUpdate):
+    targets = _shards_for_filter(shards, bulk.filter)
+    if "branch_id" in bulk.changes.model_fields_set and targets != [shards.shard_for_branch(bulk.changes.branch_id)]:
+        raise InvalidBookDataException("Перенос книг в филиал другого шарда не поддерживается")
+
+    results = shards.scatter(lambda db: update_books(db, bulk), targets)
+    return {"affected": _total(results, "affected"), "dry_run": bulk.dry_run}
+
+
+def sharded_delete_books(shards, bulk: BookBulkDelete):
+    results = shards.scatter(lambda db: delete_books(db, bulk), _shards_for_filter(shards, bulk.filter))
+    return {"affected": _total(results, "affected"), "dry_run": bulk.dry_run}
+
+
+def sharded_upsert_books(shards, books):
+    records = list({(book.title, book.author, book.branch_id): book for book in books}.values())
+    groups = defaultdict(list)
+    for record in records:
+        groups[shards.shard_for_branch(record.branch_id)].append(record)
+
+    results = shards.run([(shard, lambda db, group=group: upsert_books(db, group)) for shard, group in groups.items()])
+
+    book_ids = {}
+    for group, result in zip(groups.values(), results):
+        book_ids.update(zip(((record.title, record.author, record.branch_id) for record in group), result["book_ids"]))
+
+    return {
+        "inserted": _total(results, "inserted"),
+        "updated": _total(results, "updated"),
+        "unchanged": _total(results, "unchanged"),
+        "book_ids": [book_ids[(record.title, record.author, record.branch_id)] for record in records],
+    }
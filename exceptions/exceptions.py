@@ -38,3 +38,45 @@ class InvalidBookDataException(LibraryException):
     """Неверные данные книги"""
 
     pass
+
+
+class JobNotFoundException(LibraryException):
+    """Задача не найдена"""
+
+    pass
+
+
+class InvalidJobException(LibraryException):
+    """Неверные параметры задачи"""
+
+    pass
+
+
+class SnapshotException(LibraryException):
+    """Ошибка чтения или восстановления снимка"""
+
+    pass
+
+
+class SchemaVersionException(LibraryException):
+    """Версия схемы базы данных не совпадает с ожидаемой"""
+
+    pass
+
+
+class InvalidReportException(LibraryException):
+    """Неверные параметры отчёта"""
+
+    pass
+
+
+class ShardingNotSupportedException(LibraryException):
+    """Операция не поддерживается при шардировании"""
+
+    pass
+
+
+class ShardPlacementException(LibraryException):
+    """Книги филиала хранятся не в том шарде"""
+
+    pass
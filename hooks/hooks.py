@@ -7,6 +7,10 @@ from exceptions.exceptions import (
     DuplicateBookException,
     InsufficientCopiesException,
     InvalidBookDataException,
+    JobNotFoundException,
+    InvalidJobException,
+    InvalidReportException,
+    ShardingNotSupportedException,
 )
 
 
@@ -34,6 +38,22 @@ async def invalid_book_data_handler(request: Request, exc: InvalidBookDataExcept
     return JSONResponse(status_code=400, content={"message": f"Неверные данные книги: {str(exc)}"})
 
 
+async def job_not_found_handler(request: Request, exc: JobNotFoundException):
+    return JSONResponse(status_code=404, content={"message": f"Задача не найдена: {str(exc)}"})
+
+
+async def invalid_job_handler(request: Request, exc: InvalidJobException):
+    return JSONResponse(status_code=400, content={"message": f"Неверные параметры задачи: {str(exc)}"})
+
+
+async def invalid_report_handler(request: Request, exc: InvalidReportException):
+    return JSONResponse(status_code=400, content={"message": f"Неверные параметры отчёта: {str(exc)}"})
+
+
+async def sharding_not_supported_handler(request: Request, exc: ShardingNotSupportedException):
+    return JSONResponse(status_code=501, content={"message": f"Недоступно при шардировании: {str(exc)}"})
+
+
 exception_handlers = {
     BookNotFoundException: book_not_found_handler,
     BranchNotFoundException: branch_not_found_handler,
@@ -41,4 +61,8 @@ exception_handlers = {
     DuplicateBookException: duplicate_book_handler,
     InsufficientCopiesException: insufficient_copies_handler,
     InvalidBookDataException: invalid_book_data_handler,
+    JobNotFoundException: job_not_found_handler,
+    InvalidJobException: invalid_job_handler,
+    InvalidReportException: invalid_report_handler,
+    ShardingNotSupportedException: sharding_not_supported_handler,
 }
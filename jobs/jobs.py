@@ -0,0 +1,239 @@
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+from models.models import Book, Job
+from schemas.schemas import BookCreate, JobCreate
+from exceptions.exceptions import DuplicateBookException, InvalidJobException, JobNotFoundException
+import crud.crud as crud
+
+ACTIVE_STATUSES = ("queued", "running")
+EXPORT_DIR = "exports"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobHandler:
+    def __init__(self, fn, max_concurrency: int):
+        self.fn = fn
+        self.max_concurrency = max_concurrency
+
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind: str, max_concurrency: int = 1):
+    def register(fn):
+        JOB_HANDLERS[kind] = JobHandler(fn, max_concurrency)
+        return fn
+
+    return register
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """Отчёт о прогрессе и проверка отмены изнутри выполняющейся задачи"""
+
+    def __init__(self, session_factory, job_id: int, report_interval: float = 0.5):
+        self.job_id = job_id
+        self._session_factory = session_factory
+        self._report_interval = report_interval
+        self._reported_at = 0.0
+
+    def progress(self, done: int, total: int = None):
+        now = time.monotonic()
+        if now - self._reported_at < self._report_interval and done != total:
+            return
+        self._reported_at = now
+
+        with self._session_factory() as db:
+            job = db.get(Job, self.job_id)
+            job.progress_done = done
+            if total is not None:
+                job.progress_total = total
+            db.commit()
+            if job.cancel_requested:
+                raise JobCancelled()
+
+
+class JobRunner:
+    """Пул фоновых задач с хранением состояния в таблице jobs"""
+
+    def __init__(self, session_factory, max_workers: int = 4, handlers: dict = None):
+        self.session_factory = session_factory
+        self.max_workers = max_workers
+        self.handlers = JOB_HANDLERS if handlers is None else handlers
+        self._executor = None
+        self._running = defaultdict(int)
+        self._queued = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self.resume()
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def resume(self):
+        with self.session_factory() as db:
+            jobs = db.query(Job).filter(Job.status.in_(ACTIVE_STATUSES)).order_by(Job.id).all()
+            for job in jobs:
+                job.status = "queued"
+            db.commit()
+            pending = [(job.id, job.kind) for job in jobs]
+
+        for job_id, kind in pending:
+            self._dispatch(job_id, kind)
+
+    def submit(self, db: Session, job: JobCreate):
+        if job.kind not in self.handlers:
+            raise InvalidJobException(f"Неизвестный тип задачи '{job.kind}'")
+        try:
+            inspect.signature(self.handlers[job.kind].fn).bind(db, None, **job.params)
+        except TypeError as exc:
+            raise InvalidJobException(f"Недопустимые параметры задачи '{job.kind}': {exc}")
+
+        db_job = Job(kind=job.kind, params=job.params, status="queued", progress_done=0, cancel_requested=False)
+        db.add(db_job)
+        db.commit()
+        db.refresh(db_job)
+
+        self._dispatch(db_job.id, db_job.kind)
+        return db_job
+
+    def get(self, db: Session, job_id: int):
+        db_job = db.get(Job, job_id)
+        if not db_job:
+            raise JobNotFoundException(f"Задача с ID {job_id} не найдена")
+        return db_job
+
+    def cancel(self, db: Session, job_id: int):
+        db_job = self.get(db, job_id)
+
+        if db_job.status == "queued":
+            db_job.status = "cancelled"
+            db_job.finished_at = _now()
+        elif db_job.status == "running":
+            db_job.cancel_requested = True
+
+        db.commit()
+        db.refresh(db_job)
+        return db_job
+
+    def _dispatch(self, job_id: int, kind: str):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            handler = self.handlers.get(kind)
+            if handler is not None and self._running[kind] >= handler.max_concurrency:
+                self._queued[kind].append(job_id)
+                return
+            self._running[kind] += 1
+            self._executor.submit(self._run, job_id, kind)
+
+    def _finish_slot(self, kind: str):
+        with self._lock:
+            if self._queued[kind] and self._executor is not None:
+                self._executor.submit(self._run, self._queued[kind].popleft(), kind)
+            else:
+                self._running[kind] -= 1
+
+    def _run(self, job_id: int, kind: str):
+        try:
+            self._execute(job_id, kind)
+        finally:
+            self._finish_slot(kind)
+
+    def _execute(self, job_id: int, kind: str):
+        with self.session_factory() as db:
+            job = db.get(Job, job_id)
+            if job is None or job.status != "queued":
+                return
+
+            handler = self.handlers.get(kind)
+            if handler is None:
+                job.status = "failed"
+                job.error = f"Неизвестный тип задачи '{kind}'"
+                job.finished_at = _now()
+                db.commit()
+                return
+
+            job.status = "running"
+            job.started_at = _now()
+            db.commit()
+            params = dict(job.params or {})
+
+        context = JobContext(self.session_factory, job_id)
+        status, result, error = "succeeded", None, None
+        try:
+            with self.session_factory() as db:
+                result = handler.fn(db, context, **params)
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as exc:
+            status, error = "failed", f"{type(exc).__name__}: {exc}"
+
+        with self.session_factory() as db:
+            job = db.get(Job, job_id)
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = _now()
+            db.commit()
+
+
+@job_handler("export_books", max_concurrency=1)
+def export_books(db: Session, context: JobContext, chunk_size: int = 1000):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"books-{context.job_id}.jsonl")
+
+    total = db.query(Book).count()
+    exported = 0
+    last_id = 0
+    with open(path, "w", encoding="utf-8") as export_file:
+        while True:
+            books = db.query(Book).filter(Book.id > last_id).order_by(Book.id).limit(chunk_size).all()
+            if not books:
+                break
+            for book in books:
+                record = {column.name: getattr(book, column.name) for column in Book.__table__.columns}
+                record["faculty_ids"] = [faculty.id for faculty in book.faculties]
+                export_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            exported += len(books)
+            last_id = books[-1].id
+            db.expunge_all()
+            context.progress(exported, total)
+
+    return {"path": path, "rows": exported}
+
+
+@job_handler("import_books", max_concurrency=2)
+def import_books(db: Session, context: JobContext, books: list):
+    created, skipped = 0, 0
+    for index, record in enumerate(books, start=1):
+        try:
+            crud.create_book(db, BookCreate(**record))
+            created += 1
+        except DuplicateBookException:
+            db.rollback()
+            skipped += 1
+        context.progress(index, len(books))
+
+    return {"created": created, "skipped": skipped}
@@ -1,92 +1,485 @@
-from fastapi import FastAPI, Depends
+from startup.startup import StartupProfile
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Query, Request
 from sqlalchemy.orm import Session
-from typing import List
-from db.database import get_db, engine
-from models.models import Base
+from typing import Annotated, List, Optional
+from db.database import get_db, get_engine, new_session, warm_pool, POOL_SIZE, MAX_OVERFLOW
+from migrations.migrations import check_schema
 import crud.crud as crud
 import schemas.schemas as schemas
-from exceptions.exceptions import BookNotFoundException
+from exceptions.exceptions import BookNotFoundException, ShardingNotSupportedException
 from hooks.hooks import exception_handlers
+from middleware.middleware import ConcurrencyLimitMiddleware, IdempotencyMiddleware, IdempotencyStore, pool_limiters
+from coalescing.coalescing import SingleFlight
+from jobs.jobs import JobRunner
+from sharding.sharding import ShardMap
+from analytics.analytics import BookAnalytics, parse_percentiles
+from readmodel.readmodel import ReadModel
+
+startup_profile = StartupProfile()
+job_runner = JobRunner(new_session)
+shard_map = ShardMap.from_env(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+book_analytics = BookAnalytics()
+read_model = ReadModel.from_env() if shard_map is None else None
+
+
+def verify_schema():
+    engines = [get_engine()] + ([shard.engine for shard in shard_map.shards] if shard_map is not None else [])
+    for engine in engines:
+        with engine.connect() as connection:
+            check_schema(connection)
+    if shard_map is not None:
+        shard_map.check_placement()
+
+
+def start_read_model():
+    read_model.start(new_session)
+    crud.change_listeners.append(read_model.on_commit)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with startup_profile.phase("database"):
+        await asyncio.to_thread(verify_schema)
+    await startup_profile.warm_up(
+        {
+            "connection_pool": warm_pool,
+            "openapi": app.openapi,
+            "job_runner": job_runner.start,
+            **({"read_model": start_read_model} if read_model is not None else {}),
+        }
+    )
+    yield
+    job_runner.shutdown()
+    if read_model is not None:
+        crud.change_listeners.remove(read_model.on_commit)
+        read_model.shutdown()
+    if shard_map is not None:
+        shard_map.dispose()
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Library Management System")
+app = FastAPI(title="Library Management System", lifespan=lifespan)
 
 for exception, handler in exception_handlers.items():
     app.add_exception_handler(exception, handler)
 
+LOOKUP_ROUTES = {
+    "/branches/{branch_name}/books/{book_title}/copies",
+    "/books/{book_title}/branches/{branch_name}/faculties",
+    "/books/{book_id}",
+    "/works/{work_id}/availability",
+    "/changes",
+}
+EXEMPT_ROUTES = {
+    "/",
+    "/metrics",
+    app.openapi_url,
+    app.docs_url,
+    app.redoc_url,
+    app.swagger_ui_oauth2_redirect_url,
+}
+
+limiters = pool_limiters(POOL_SIZE + MAX_OVERFLOW)
+app.add_middleware(
+    ConcurrencyLimitMiddleware,
+    routes=app.router.routes,
+    limiters=limiters,
+    lookup_routes=LOOKUP_ROUTES,
+    exempt_routes=EXEMPT_ROUTES,
+)
+
+idempotency_store = IdempotencyStore()
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+read_flight = SingleFlight()
+
+
+def get_shards():
+    return shard_map
+
+
+def require_single_database(request: Request, shards: Optional[ShardMap] = Depends(get_shards)):
+    # Работы, журнал изменений, отчёты и фоновые задачи работают с одной базой и не видят остальные шарды
+    if shards is not None:
+        raise ShardingNotSupportedException(f"{request.url.path} не объединяет данные нескольких шардов")
+
+
+def get_read_model():
+    return read_model if read_model is not None and read_model.ready else None
+
 
 @app.get("/")
 def read_root():
     return {"message": "Добро пожаловать в систему управления библиотекой!"}
 
 
+@app.get("/metrics")
+def read_metrics():
+    return {
+        "concurrency": {name: limiter.stats() for name, limiter in limiters.items()},
+        "coalescing": read_flight.stats(),
+        "idempotency": idempotency_store.stats(),
+        "startup": startup_profile.report(),
+        "analytics": book_analytics.stats(),
+        "read_model": read_model.stats() if read_model is not None else None,
+    }
+
+
 @app.get("/branches/{branch_name}/books/{book_title}/copies")
-def get_book_copies_in_branch(branch_name: str, book_title: str, db: Session = Depends(get_db)):
-    copies_count = crud.get_book_copies_in_branch(db, branch_name, book_title)
+def get_book_copies_in_branch(
+    branch_name: str,
+    book_title: str,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+    model: Optional[ReadModel] = Depends(get_read_model),
+):
+    if model is not None:
+        copies_count = model.get_book_copies_in_branch(branch_name, book_title)
+        return {"branch_name": branch_name, "book_title": book_title, "copies_count": copies_count}
+    copies_count = read_flight.do(
+        ("copies", branch_name, book_title),
+        lambda: (
+            crud.sharded_get_book_copies_in_branch(shards, branch_name, book_title)
+            if shards is not None
+            else crud.get_book_copies_in_branch(db, branch_name, book_title)
+        ),
+    )
     return {"branch_name": branch_name, "book_title": book_title, "copies_count": copies_count}
 
 
 @app.get("/books/{book_title}/branches/{branch_name}/faculties")
-def get_book_faculties_in_branch(book_title: str, branch_name: str, db: Session = Depends(get_db)):
-    return crud.get_book_faculties_in_branch(db, book_title, branch_name)
+def get_book_faculties_in_branch(
+    book_title: str,
+    branch_name: str,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+    model: Optional[ReadModel] = Depends(get_read_model),
+):
+    if model is not None:
+        return model.get_book_faculties_in_branch(book_title, branch_name)
+    return read_flight.do(
+        ("faculties", book_title, branch_name),
+        lambda: (
+            crud.sharded_get_book_faculties_in_branch(shards, book_title, branch_name)
+            if shards is not None
+            else crud.get_book_faculties_in_branch(db, book_title, branch_name)
+        ),
+    )
 
 
 @app.post("/books/", response_model=schemas.Book)
-def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
+def create_book(
+    book: schemas.BookCreate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_create_book(shards, book)
     return crud.create_book(db, book)
 
 
-@app.get("/books/", response_model=List[schemas.Book])
-def read_books(db: Session = Depends(get_db)):
-    return crud.get_books(db)
+@app.post("/books/faculties", response_model=schemas.FacultyAssignmentResult)
+def assign_faculties(
+    assignment: schemas.FacultyAssignment,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_assign_faculties(shards, assignment)
+    return crud.assign_faculties(db, assignment)
+
+
+@app.delete("/books/faculties", response_model=schemas.FacultyAssignmentResult)
+def remove_faculties(
+    assignment: schemas.FacultyAssignment,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_remove_faculties(shards, assignment)
+    return crud.remove_faculties(db, assignment)
+
+
+@app.get("/books/", response_model=None, responses={200: {"model": List[schemas.Book]}})
+def read_books(
+    params: Annotated[schemas.BookListParams, Query()],
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    fields, expand_faculties = crud.parse_book_fieldset(params.fields, params.expand)
+    model = schemas.book_response_model(fields, expand_faculties)
+
+    if shards is not None:
+        return read_flight.do(
+            ("books", params.model_dump_json()),
+            lambda: crud.sharded_get_books(
+                shards, params, params.sort, params.skip, params.limit, fields, expand_faculties
+            ),
+        )
+
+    return read_flight.do(
+        ("books", params.model_dump_json()),
+        lambda: [
+            model.model_validate(book)
+            for book in crud.get_books(
+                db, params, params.sort, params.skip, params.limit, fields, expand_faculties
+            )
+        ],
+    )
+
+
+@app.get("/books/{book_id}", response_model=None, responses={200: {"model": schemas.Book}})
+def read_book(
+    book_id: int,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    book_fields, expand_faculties = crud.parse_book_fieldset(fields, expand)
+    model = schemas.book_response_model(book_fields, expand_faculties)
+
+    def load_book():
+        if shards is not None:
+            db_book = crud.sharded_get_book(shards, book_id, book_fields, expand_faculties)
+        else:
+            db_book = crud.get_book(db, book_id, book_fields, expand_faculties)
+        if not db_book:
+            raise BookNotFoundException(f"Книга с ID {book_id} не найдена")
+        return model.model_validate(db_book)
+
+    return read_flight.do(("book", book_id, book_fields, expand_faculties), load_book)
 
 
-@app.get("/books/{book_id}", response_model=schemas.Book)
-def read_book(book_id: int, db: Session = Depends(get_db)):
-    db_book = crud.get_book(db, book_id)
-    if not db_book:
-        raise BookNotFoundException(f"Книга с ID {book_id} не найдена")
-    return db_book
+@app.put("/books/", response_model=schemas.BookUpsertResult)
+def upsert_book(
+    book: schemas.BookCreate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_upsert_books(shards, [book])
+    return crud.upsert_books(db, [book])
+
+
+@app.put("/books/batch", response_model=schemas.BookUpsertResult)
+def upsert_books(
+    books: List[schemas.BookCreate],
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_upsert_books(shards, books)
+    return crud.upsert_books(db, books)
+
+
+@app.patch("/books/", response_model=schemas.BulkResult)
+def update_books(
+    bulk: schemas.BookBulkUpdate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_update_books(shards, bulk)
+    return crud.update_books(db, bulk)
+
+
+@app.delete("/books/", response_model=schemas.BulkResult)
+def delete_books(
+    bulk: schemas.BookBulkDelete,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_delete_books(shards, bulk)
+    return crud.delete_books(db, bulk)
 
 
 @app.put("/books/{book_id}", response_model=schemas.Book)
-def update_book(book_id: int, book: schemas.BookUpdate, db: Session = Depends(get_db)):
+def update_book(
+    book_id: int,
+    book: schemas.BookUpdate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_update_book(shards, book_id, book)
     return crud.update_book(db, book_id, book)
 
 
 @app.delete("/books/{book_id}")
-def delete_book(book_id: int, db: Session = Depends(get_db)):
+def delete_book(book_id: int, db: Session = Depends(get_db), shards: Optional[ShardMap] = Depends(get_shards)):
+    if shards is not None:
+        return crud.sharded_delete_book(shards, book_id)
     return crud.delete_book(db, book_id)
 
 
 @app.post("/branches/", response_model=schemas.Branch)
-def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db)):
+def create_branch(
+    branch: schemas.BranchCreate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_create_branch(shards, branch)
     return crud.create_branch(db, branch)
 
 
 @app.get("/branches/", response_model=List[schemas.Branch])
-def read_branches(db: Session = Depends(get_db)):
-    return crud.get_branches(db)
+def read_branches(db: Session = Depends(get_db), model: Optional[ReadModel] = Depends(get_read_model)):
+    if model is not None:
+        return [schemas.Branch.model_validate(branch) for branch in model.get_branches()]
+    return read_flight.do(
+        ("branches",),
+        lambda: [schemas.Branch.model_validate(branch) for branch in crud.get_branches(db)],
+    )
 
 
 @app.put("/branches/{branch_id}", response_model=schemas.Branch)
-def update_branch(branch_id: int, branch: schemas.BranchCreate, db: Session = Depends(get_db)):
+def update_branch(
+    branch_id: int,
+    branch: schemas.BranchCreate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_update_branch(shards, branch_id, branch)
     return crud.update_branch(db, branch_id, branch)
 
 
 @app.post("/faculties/", response_model=schemas.Faculty)
-def create_faculty(faculty: schemas.FacultyCreate, db: Session = Depends(get_db)):
+def create_faculty(
+    faculty: schemas.FacultyCreate,
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    if shards is not None:
+        return crud.sharded_create_faculty(shards, faculty)
     return crud.create_faculty(db, faculty)
 
 
 @app.get("/faculties/", response_model=List[schemas.Faculty])
-def read_faculties(db: Session = Depends(get_db)):
-    return crud.get_faculties(db)
+def read_faculties(db: Session = Depends(get_db), model: Optional[ReadModel] = Depends(get_read_model)):
+    if model is not None:
+        return [schemas.Faculty.model_validate(faculty) for faculty in model.get_faculties()]
+    return read_flight.do(
+        ("faculties",),
+        lambda: [schemas.Faculty.model_validate(faculty) for faculty in crud.get_faculties(db)],
+    )
+
+
+@app.get("/works/", response_model=List[schemas.Work], dependencies=[Depends(require_single_database)])
+def read_works(title: Optional[str] = None, author: Optional[str] = None, db: Session = Depends(get_db)):
+    return read_flight.do(
+        ("works", title, author),
+        lambda: [schemas.Work.model_validate(work) for work in crud.get_works(db, title, author)],
+    )
+
+
+@app.get(
+    "/works/{work_id}/availability",
+    response_model=schemas.WorkAvailability,
+    dependencies=[Depends(require_single_database)],
+)
+def read_work_availability(work_id: int, db: Session = Depends(get_db)):
+    return read_flight.do(("work_availability", work_id), lambda: crud.get_work_availability(db, work_id))
+
+
+@app.get("/faculties/{faculty_id}/books", response_model=schemas.FacultyBooks)
+def read_faculty_books(
+    faculty_id: int,
+    branch_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    shards: Optional[ShardMap] = Depends(get_shards),
+):
+    return read_flight.do(
+        ("faculty_books", faculty_id, branch_id, skip, limit),
+        lambda: (
+            crud.sharded_get_faculty_books(shards, faculty_id, branch_id, skip, limit)
+            if shards is not None
+            else crud.get_faculty_books(db, faculty_id, branch_id, skip, limit)
+        ),
+    )
+
+
+@app.get("/changes", response_model=schemas.ChangesPage, dependencies=[Depends(require_single_database)])
+def read_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    return read_flight.do(("changes", since, limit), lambda: crud.get_changes(db, since, limit))
+
+
+@app.get(
+    "/reports/inventory", response_model=schemas.InventoryReport, dependencies=[Depends(require_single_database)]
+)
+def read_inventory_report(
+    group_by: str = "branch",
+    branch_id: Optional[int] = None,
+    faculty_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+):
+    book_analytics.refresh(db)
+    return book_analytics.inventory(group_by, branch_id, faculty_id, limit)
+
+
+@app.get(
+    "/reports/distribution", response_model=schemas.DistributionReport, dependencies=[Depends(require_single_database)]
+)
+def read_distribution_report(
+    metric: str = "price",
+    percentiles: str = "25,50,75,90,99",
+    bins: int = Query(10, ge=1, le=1000),
+    branch_id: Optional[int] = None,
+    faculty_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    book_analytics.refresh(db)
+    return book_analytics.distribution(metric, parse_percentiles(percentiles), bins, branch_id, faculty_id)
+
+
+@app.get(
+    "/reports/top-books", response_model=schemas.TopBooksReport, dependencies=[Depends(require_single_database)]
+)
+def read_top_books_report(
+    metric: str = "inventory_value",
+    n: int = Query(10, ge=1, le=1000),
+    branch_id: Optional[int] = None,
+    faculty_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    book_analytics.refresh(db)
+    return book_analytics.top_books(metric, n, branch_id, faculty_id)
+
+
+def get_job_runner():
+    return job_runner
+
+
+@app.post("/jobs/", response_model=schemas.Job, dependencies=[Depends(require_single_database)])
+def submit_job(job: schemas.JobCreate, db: Session = Depends(get_db), runner: JobRunner = Depends(get_job_runner)):
+    return runner.submit(db, job)
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_db), runner: JobRunner = Depends(get_job_runner)):
+    return runner.get(db, job_id)
+
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(job_id: int, db: Session = Depends(get_db), runner: JobRunner = Depends(get_job_runner)):
+    return runner.cancel(db, job_id)
+
+
+startup_profile.mark("import")
 
 
 if __name__ == "__main__":
     import uvicorn
-    create_tables()
     uvicorn.run(app="main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,373 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+READ_METHODS = {"GET", "HEAD"}
+
+
+class _Waiter:
+    __slots__ = ("future", "granted")
+
+    def __init__(self, future):
+        self.future = future
+        self.granted = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Лимит одновременных запросов, подстраиваемый по наблюдаемой задержке"""
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        min_limit: int = 1,
+        max_queue: int = 0,
+        queue_timeout: float = 0.0,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.short_latency = None
+        self.long_latency = None
+
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight < self.current_limit and not self._waiters:
+                self.in_flight += 1
+                return True
+            if len(self._waiters) >= self.max_queue or self.queue_timeout <= 0:
+                self.rejected += 1
+                return False
+            waiter = _Waiter(asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self._give_back()
+            raise
+
+        return self._abandon(waiter)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            return False
+
+    def release(self, latency: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self._observe(latency)
+            self._grant_waiters()
+
+    def _give_back(self):
+        # Место выдано, но запрос отменён до начала работы: возвращаем его без учёта задержки
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_waiters()
+
+    def _grant_waiters(self):
+        while self._waiters and self.in_flight < self.current_limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.future.get_loop().call_soon_threadsafe(_wake, waiter.future)
+
+    def _observe(self, latency: float):
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+
+        self.short_latency += (latency - self.short_latency) * 0.1
+        self.long_latency += (latency - self.long_latency) * 0.01
+        if self.long_latency > self.short_latency:
+            self.long_latency = self.short_latency
+
+        if self.in_flight + 1 < self.current_limit / 2 and self.short_latency <= self.long_latency * self.tolerance:
+            return
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_latency / self.short_latency))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(float(self.min_limit), min(float(self.max_limit), new_limit))
+
+    def retry_after(self) -> int:
+        latency = self.short_latency or self.queue_timeout or 1.0
+        return max(1, math.ceil(latency * (len(self._waiters) + 1) / self.current_limit))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.current_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "latency_ms": round((self.short_latency or 0.0) * 1000, 3),
+            }
+
+
+def pool_limiters(pool_capacity: int) -> dict:
+    return {
+        "lookup": AdaptiveLimiter("lookup", max_limit=pool_capacity, max_queue=pool_capacity * 4, queue_timeout=0.5),
+        "scan": AdaptiveLimiter(
+            "scan", max_limit=max(1, pool_capacity // 3), max_queue=pool_capacity, queue_timeout=0.1
+        ),
+        "write": AdaptiveLimiter(
+            "write", max_limit=max(1, pool_capacity // 2), max_queue=pool_capacity * 2, queue_timeout=1.0
+        ),
+    }
+
+
+class ConcurrencyLimitMiddleware:
+    """Ограничивает число запросов к БД по классам маршрутов и сбрасывает лишнюю нагрузку"""
+
+    def __init__(self, app, routes, limiters: dict, lookup_routes=(), exempt_routes=()):
+        self.app = app
+        self.routes = routes
+        self.limiters = limiters
+        self.lookup_routes = set(lookup_routes)
+        self.exempt_routes = set(exempt_routes)
+
+    def route_class(self, scope):
+        path = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                path = route.path
+                break
+
+        if path is None or path in self.exempt_routes:
+            return None
+        if scope["method"] not in READ_METHODS:
+            return "write"
+        if path in self.lookup_routes:
+            return "lookup"
+        return "scan"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters.get(self.route_class(scope))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limiter.acquire():
+            response = JSONResponse(
+                status_code=503,
+                content={"message": f"Сервис перегружен: превышен лимит запросов класса '{limiter.name}'"},
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+
+class _PendingResponse:
+    __slots__ = ("fingerprint", "waiters")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.waiters = []
+
+
+class _StoredResponse:
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires_at")
+
+    def __init__(self, fingerprint: str, status: int, headers: list, body: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Хранилище ответов по ключам идемпотентности с вытеснением по TTL"""
+
+    def __init__(self, ttl: float = 24 * 60 * 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.replayed = 0
+        self._pending = {}
+        self._stored = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, fingerprint: str):
+        with self._lock:
+            self._evict(time.monotonic())
+
+            stored = self._stored.get(key)
+            if stored is not None:
+                if stored.fingerprint == fingerprint:
+                    self.replayed += 1
+                return stored, None
+
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = _PendingResponse(fingerprint)
+                return None, None
+            if pending.fingerprint != fingerprint:
+                return pending, None
+
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            return pending, waiter
+
+    def complete(self, key, status: int, headers: list, body: bytes):
+        with self._lock:
+            pending = self._pending.pop(key)
+            self._stored[key] = _StoredResponse(pending.fingerprint, status, headers, body, time.monotonic() + self.ttl)
+        self._wake_all(pending)
+
+    def release(self, key):
+        with self._lock:
+            pending = self._pending.pop(key)
+        self._wake_all(pending)
+
+    def _wake_all(self, pending: _PendingResponse):
+        for waiter in pending.waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    def _evict(self, now: float):
+        while self._stored:
+            key, stored = next(iter(self._stored.items()))
+            if stored.expires_at > now and len(self._stored) <= self.max_entries:
+                return
+            del self._stored[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"stored": len(self._stored), "in_flight": len(self._pending), "replayed": self.replayed}
+
+
+class IdempotencyMiddleware:
+    """Повторяет сохранённый ответ на запись с уже использованным Idempotency-Key"""
+
+    header = b"idempotency-key"
+
+    def __init__(self, app, store: IdempotencyStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = dict(scope["headers"]).get(self.header)
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        key = (scope["method"], scope["path"], idempotency_key.decode("latin-1"))
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        while True:
+            entry, waiter = self.store.claim(key, fingerprint)
+            if waiter is None:
+                break
+            await waiter
+
+        if entry is not None and entry.fingerprint != fingerprint:
+            response = JSONResponse(
+                status_code=422,
+                content={"message": "Ключ идемпотентности уже использован с другим запросом"},
+            )
+            await response(scope, receive, send)
+            return
+
+        if entry is not None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": entry.status,
+                    "headers": entry.headers + [(b"idempotency-replayed", b"true")],
+                }
+            )
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        await self._run(key, scope, body, receive, send)
+
+    async def _run(self, key, scope, body: bytes, receive, send):
+        replayed = False
+        response = {"status": 500, "headers": [], "body": b""}
+
+        async def receive_buffered():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_capturing(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, receive_buffered, send_capturing)
+        except BaseException:
+            self.store.release(key)
+            raise
+
+        if response["status"] >= 500:
+            self.store.release(key)
+        else:
+            self.store.complete(key, response["status"], response["headers"], response["body"])
@@ -0,0 +1,141 @@
+from sqlalchemy import DDL, Index, String, cast, column, delete, func, insert, inspect, literal, select, table, update
+from sqlalchemy.exc import DBAPIError
+from models.models import Base, Book, Branch, Change, Faculty, SchemaVersion, Work, book_faculty
+from exceptions.exceptions import SchemaVersionException
+
+
+def _add_missing_column(connection, table, column_name: str, definition: str):
+    columns = {existing["name"] for existing in inspect(connection).get_columns(table.name)}
+    if column_name not in columns:
+        connection.execute(DDL(f"ALTER TABLE {table.name} ADD COLUMN {column_name} {definition}"))
+
+
+def _create_missing_index(connection, index: Index):
+    indexes = {existing["name"] for existing in inspect(connection).get_indexes(index.table.name)}
+    if index.name not in indexes:
+        index.create(connection)
+
+
+def migrate_books_to_works(connection):
+    Work.__table__.create(connection, checkfirst=True)
+    _add_missing_column(connection, Book.__table__, "work_id", "INTEGER REFERENCES works (id)")
+
+    books = table("books", column("title"), column("author"))
+    connection.execute(
+        Work.__table__.insert().from_select(
+            ["title", "author"],
+            select(books.c.title, books.c.author)
+            .where(~select(Work.id).where(Work.title == books.c.title, Work.author == books.c.author).exists())
+            .group_by(books.c.title, books.c.author),
+        )
+    )
+
+    books = table("books", column("title"), column("author"), column("work_id"))
+    connection.execute(
+        update(books)
+        .where(books.c.work_id.is_(None))
+        .values(
+            work_id=select(Work.id).where(Work.title == books.c.title, Work.author == books.c.author).scalar_subquery()
+        )
+    )
+
+
+def add_change_tracking(connection):
+    Change.__table__.create(connection, checkfirst=True)
+    for model in (Book, Branch, Faculty):
+        _add_missing_column(connection, model.__table__, "updated_at", "TIMESTAMP WITH TIME ZONE")
+
+    # Журнал начинается с текущего состояния, иначе клиенты с since=0 не увидят уже существующие строки
+    if connection.execute(select(Change.seq).limit(1)).first() is not None:
+        return
+    for entity in ("branches", "faculties", "books"):
+        rows = table(entity, column("id"))
+        connection.execute(
+            insert(Change).from_select(
+                ["entity", "entity_key", "op"],
+                select(literal(entity), cast(rows.c.id, String), literal("insert")).order_by(rows.c.id),
+            )
+        )
+    links = table("book_faculty", column("book_id"), column("faculty_id"))
+    connection.execute(
+        insert(Change).from_select(
+            ["entity", "entity_key", "op"],
+            select(
+                literal("book_faculty"),
+                cast(links.c.book_id, String) + ":" + cast(links.c.faculty_id, String),
+                literal("insert"),
+            ).order_by(links.c.book_id, links.c.faculty_id),
+        )
+    )
+
+
+def unique_book_faculty_links(connection):
+    links = table("book_faculty", column("book_id"), column("faculty_id"))
+    duplicates = connection.execute(
+        select(links.c.book_id, links.c.faculty_id)
+        .group_by(links.c.book_id, links.c.faculty_id)
+        .having(func.count() > 1)
+    ).all()
+    for book_id, faculty_id in duplicates:
+        connection.execute(delete(links).where(links.c.book_id == book_id, links.c.faculty_id == faculty_id))
+        connection.execute(insert(links).values(book_id=book_id, faculty_id=faculty_id))
+
+    # Прежний неуникальный индекс с тем же именем пересоздаётся в create_indexes уже уникальным
+    for index in inspect(connection).get_indexes(book_faculty.name):
+        if index["name"] == "ix_book_faculty_faculty_id_book_id" and not index["unique"]:
+            connection.execute(DDL(f"DROP INDEX {index['name']}"))
+
+
+def create_indexes(connection):
+    for indexed_table in (Work.__table__, Book.__table__, book_faculty):
+        for index in sorted(indexed_table.indexes, key=lambda index: index.name):
+            _create_missing_index(connection, index)
+
+
+MIGRATIONS = [
+    migrate_books_to_works,
+    add_change_tracking,
+    unique_book_faculty_links,
+    create_indexes,
+]
+
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(connection):
+    Base.metadata.create_all(bind=connection)
+    for migration in MIGRATIONS:
+        migration(connection)
+
+    connection.execute(delete(SchemaVersion))
+    connection.execute(insert(SchemaVersion).values(version=SCHEMA_VERSION))
+
+
+def schema_version(connection):
+    try:
+        return connection.execute(select(func.max(SchemaVersion.version))).scalar()
+    except DBAPIError:
+        return None
+
+
+def check_schema(connection):
+    version = schema_version(connection)
+    if version != SCHEMA_VERSION:
+        raise SchemaVersionException(
+            f"Версия схемы базы данных {version} не совпадает с ожидаемой {SCHEMA_VERSION}: "
+            "выполните python -m migrations.migrations"
+        )
+
+
+if __name__ == "__main__":
+    from db.database import engine
+    from sharding.sharding import ShardMap
+
+    with engine.begin() as connection:
+        migrate(connection)
+
+    shard_map = ShardMap.from_env()
+    if shard_map is not None:
+        shard_map.create_all()
+        shard_map.dispose()
@@ -1,4 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, Table, ForeignKey
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    UniqueConstraint,
+    func,
+)
 from sqlalchemy.orm import relationship
 from db.database import Base
 
@@ -7,27 +20,67 @@ book_faculty = Table(
     Base.metadata,
     Column("book_id", Integer, ForeignKey("books.id")),
     Column("faculty_id", Integer, ForeignKey("faculties.id")),
+    Index("ix_book_faculty_faculty_id_book_id", "faculty_id", "book_id", unique=True),
 )
 
 
+class Work(Base):
+    __tablename__ = "works"
+    __table_args__ = (UniqueConstraint("title", "author", name="uq_works_title_author"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, index=True, nullable=False)
+    author = Column(String, nullable=False)
+
+    holdings = relationship("Book", back_populates="work")
+
+
 class Book(Base):
     __tablename__ = "books"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
-    author = Column(String, nullable=False)
-    publisher = Column(String)
-    year = Column(Integer)
+    author = Column(String, nullable=False, index=True)
+    publisher = Column(String, index=True)
+    year = Column(Integer, index=True)
     pages = Column(Integer)
     illustrations = Column(Integer)
-    price = Column(Float)
-    branch_id = Column(Integer, ForeignKey("branches.id"))
-    copies_available = Column(Integer, default=0)
+    price = Column(Float, index=True)
+    branch_id = Column(Integer, ForeignKey("branches.id"), index=True)
+    work_id = Column(Integer, ForeignKey("works.id"), index=True)
+    copies_available = Column(Integer, default=0, index=True)
     students_borrowed_count = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     branch = relationship("Branch", back_populates="books")
+    work = relationship("Work", back_populates="holdings")
     faculties = relationship("Faculty", secondary=book_faculty, back_populates="books")
 
+    __table_args__ = (
+        Index(
+            "ix_books_in_stock",
+            "id",
+            sqlite_where=copies_available > 0,
+            postgresql_where=copies_available > 0,
+        ),
+        Index(
+            "ix_books_in_stock_title",
+            "title",
+            "id",
+            sqlite_where=copies_available > 0,
+            postgresql_where=copies_available > 0,
+        ),
+        Index(
+            "ix_books_in_stock_price",
+            "price",
+            "id",
+            sqlite_where=copies_available > 0,
+            postgresql_where=copies_available > 0,
+        ),
+        Index("uq_books_title_author_branch", "title", "author", "branch_id", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
 
 class Branch(Base):
     __tablename__ = "branches"
@@ -35,6 +88,7 @@ class Branch(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
     address = Column(String)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     books = relationship("Book", back_populates="branch")
 
@@ -44,5 +98,39 @@ class Faculty(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     books = relationship("Book", secondary=book_faculty, back_populates="faculties")
+
+
+class Change(Base):
+    __tablename__ = "changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)
+    entity_key = Column(String, nullable=False)
+    op = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, index=True, default="queued")
+    params = Column(JSON, nullable=False, default=dict)
+    progress_done = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer)
+    result = Column(JSON)
+    error = Column(String)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
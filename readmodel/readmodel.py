@@ -0,0 +1,362 @@
+import os
+import sys
+import threading
+from array import array
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from models.models import Book, Branch, Change, Faculty, book_faculty
+from exceptions.exceptions import BookNotFoundException, BranchNotFoundException
+
+SYNC_CHUNK_SIZE = 500
+CHECK_INTERVAL = 5.0
+NO_BRANCH = -1
+
+
+def _chunks(items: list):
+    for start in range(0, len(items), SYNC_CHUNK_SIZE):
+        end = start + SYNC_CHUNK_SIZE
+        yield items[start:end]
+
+
+def _select_in(db: Session, query, key, ids: list) -> list:
+    rows = []
+    for chunk in _chunks(ids):
+        rows.extend(db.execute(query.where(key.in_(chunk))).all())
+    return rows
+
+
+class BranchEntry:
+    __slots__ = ("id", "name", "address")
+
+    def __init__(self, id: int, name: str, address: str = None):
+        self.id = id
+        self.name = name
+        self.address = address
+
+
+class FacultyEntry:
+    __slots__ = ("id", "name")
+
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+
+
+class ReadModel:
+    """Компактная копия филиалов, факультетов и остатков книг в памяти процесса"""
+
+    _STATE = (
+        "branches",
+        "branch_ids",
+        "faculties",
+        "_slots",
+        "_free",
+        "_book_ids",
+        "_branch_of",
+        "_copies",
+        "_titles",
+        "_faculty_ids",
+        "_index",
+    )
+
+    __slots__ = (
+        "check_interval",
+        "version",
+        "loaded",
+        "stale",
+        "reloads",
+        "syncs",
+        "branches",
+        "branch_ids",
+        "faculties",
+        "_slots",
+        "_free",
+        "_book_ids",
+        "_branch_of",
+        "_copies",
+        "_titles",
+        "_faculty_ids",
+        "_index",
+        "_lock",
+        "_sync_lock",
+        "_stop",
+        "_thread",
+    )
+
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = 0
+        self.loaded = False
+        self.stale = False
+        self.reloads = 0
+        self.syncs = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset()
+
+    @classmethod
+    def from_env(cls, variable: str = "READ_MODEL"):
+        enabled = os.environ.get(variable, "").strip().lower() in ("1", "true", "yes", "on")
+        return cls() if enabled else None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded and not self.stale
+
+    def _reset(self):
+        self.branches = {}
+        self.branch_ids = {}
+        self.faculties = {}
+        self._slots = {}
+        self._free = []
+        self._book_ids = array("q")
+        self._branch_of = array("q")
+        self._copies = array("q")
+        self._titles = []
+        self._faculty_ids = []
+        self._index = {}
+
+    def load(self, db: Session):
+        with self._sync_lock:
+            self._load(db)
+
+    def _load(self, db: Session):
+        # Позиция журнала читается до данных: изменения после неё будут применены повторно, это безопасно
+        version = db.execute(select(func.coalesce(func.max(Change.seq), 0))).scalar()
+
+        fresh = ReadModel(self.check_interval)
+        for row in db.execute(select(Branch.id, Branch.name, Branch.address)):
+            fresh._put_branch(row)
+        for row in db.execute(select(Faculty.id, Faculty.name)):
+            fresh.faculties[row.id] = FacultyEntry(row.id, row.name)
+
+        links = {}
+        for book_id, faculty_id in db.execute(select(book_faculty.c.book_id, book_faculty.c.faculty_id)):
+            links.setdefault(book_id, []).append(faculty_id)
+        rows = db.execute(select(Book.id, Book.title, Book.branch_id, Book.copies_available).order_by(Book.id))
+        for row in rows:
+            fresh._put_book(row, links.get(row.id, ()))
+
+        with self._lock:
+            for name in self._STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.version = version
+            self.loaded, self.stale = True, False
+            self.reloads += 1
+
+    def _put_branch(self, row):
+        previous = self.branches.get(row.id)
+        if previous is not None:
+            self.branch_ids.pop(previous.name, None)
+        self.branches[row.id] = BranchEntry(row.id, row.name, row.address)
+        self.branch_ids[row.name] = row.id
+
+    def _drop_branch(self, branch_id: int):
+        previous = self.branches.pop(branch_id, None)
+        if previous is not None:
+            self.branch_ids.pop(previous.name, None)
+
+    def _put_book(self, row, faculty_ids):
+        faculty_ids = tuple(sorted(faculty_ids))
+        branch_id = NO_BRANCH if row.branch_id is None else row.branch_id
+        if self._free:
+            slot = self._free.pop()
+            self._book_ids[slot] = row.id
+            self._branch_of[slot] = branch_id
+            self._copies[slot] = row.copies_available or 0
+            self._titles[slot] = row.title
+            self._faculty_ids[slot] = faculty_ids
+        else:
+            slot = len(self._book_ids)
+            self._book_ids.append(row.id)
+            self._branch_of.append(branch_id)
+            self._copies.append(row.copies_available or 0)
+            self._titles.append(row.title)
+            self._faculty_ids.append(faculty_ids)
+        self._slots[row.id] = slot
+        # Книга без филиала не находится ни одним поиском по филиалу, поэтому в индекс не попадает
+        if branch_id == NO_BRANCH:
+            return
+
+        titles = self._index.setdefault(branch_id, {})
+        current = titles.get(row.title)
+        if current is None:
+            titles[row.title] = slot
+        elif isinstance(current, list):
+            current.append(slot)
+            current.sort(key=self._book_ids.__getitem__)
+        else:
+            titles[row.title] = sorted((current, slot), key=self._book_ids.__getitem__)
+
+    def _drop_book(self, book_id: int):
+        slot = self._slots.pop(book_id, None)
+        if slot is None:
+            return
+        if self._branch_of[slot] != NO_BRANCH:
+            titles = self._index[self._branch_of[slot]]
+            title = self._titles[slot]
+            current = titles[title]
+            if isinstance(current, list):
+                current.remove(slot)
+                if len(current) == 1:
+                    titles[title] = current[0]
+            else:
+                del titles[title]
+
+        self._titles[slot] = None
+        self._faculty_ids[slot] = ()
+        self._free.append(slot)
+
+    def sync(self, db: Session):
+        with self._sync_lock:
+            if not self.loaded:
+                self._load(db)
+                return
+            query = select(Change.seq, Change.entity, Change.entity_key).where(Change.seq > self.version)
+            changes = db.execute(query.order_by(Change.seq)).all()
+            if not changes:
+                return
+
+            touched = {"books": set(), "branches": set(), "faculties": set()}
+            for change in changes:
+                if change.entity == "book_faculty":
+                    touched["books"].add(int(change.entity_key.split(":")[0]))
+                elif change.entity in touched:
+                    touched[change.entity].add(int(change.entity_key))
+
+            branch_ids, faculty_ids, book_ids = (sorted(touched[name]) for name in ("branches", "faculties", "books"))
+            branches = _select_in(db, select(Branch.id, Branch.name, Branch.address), Branch.id, branch_ids)
+            faculties = _select_in(db, select(Faculty.id, Faculty.name), Faculty.id, faculty_ids)
+            books = _select_in(
+                db, select(Book.id, Book.title, Book.branch_id, Book.copies_available), Book.id, book_ids
+            )
+            links = {}
+            link_query = select(book_faculty.c.book_id, book_faculty.c.faculty_id)
+            for book_id, faculty_id in _select_in(db, link_query, book_faculty.c.book_id, book_ids):
+                links.setdefault(book_id, []).append(faculty_id)
+
+            with self._lock:
+                for branch_id in set(branch_ids) - {row.id for row in branches}:
+                    self._drop_branch(branch_id)
+                for row in branches:
+                    self._put_branch(row)
+                for faculty_id in set(faculty_ids) - {row.id for row in faculties}:
+                    self.faculties.pop(faculty_id, None)
+                for row in faculties:
+                    self.faculties[row.id] = FacultyEntry(row.id, row.name)
+                for book_id in book_ids:
+                    self._drop_book(book_id)
+                for row in books:
+                    self._put_book(row, links.get(row.id, ()))
+
+                self.version = changes[-1].seq
+                self.syncs += 1
+
+    def on_commit(self, db: Session):
+        try:
+            self.sync(db)
+        except Exception:
+            self.stale = True
+
+    def verify(self, db: Session) -> bool:
+        latest = db.execute(select(func.coalesce(func.max(Change.seq), 0))).scalar()
+        if self.ready and latest == self.version:
+            return True
+        if self.ready and latest >= self.version:
+            self.sync(db)
+        else:
+            self.load(db)
+        return False
+
+    def start(self, session_factory):
+        with session_factory() as db:
+            self.load(db)
+
+        def check():
+            while not self._stop.wait(self.check_interval):
+                try:
+                    with session_factory() as db:
+                        self.verify(db)
+                except Exception:
+                    self.stale = True
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=check, name="read-model", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _branch_id(self, branch_name: str) -> int:
+        branch_id = self.branch_ids.get(branch_name)
+        if branch_id is None:
+            raise BranchNotFoundException(f"Филиал '{branch_name}' не найден")
+        return branch_id
+
+    def _book_slot(self, branch_id: int, book_title: str):
+        slot = self._index.get(branch_id, {}).get(book_title)
+        return slot[0] if isinstance(slot, list) else slot
+
+    def get_book_copies_in_branch(self, branch_name: str, book_title: str) -> int:
+        with self._lock:
+            slot = self._book_slot(self._branch_id(branch_name), book_title)
+            return 0 if slot is None else self._copies[slot]
+
+    def get_book_faculties_in_branch(self, book_title: str, branch_name: str) -> dict:
+        with self._lock:
+            slot = self._book_slot(self._branch_id(branch_name), book_title)
+            if slot is None:
+                raise BookNotFoundException(f"Книга '{book_title}' не найдена в филиале '{branch_name}'")
+            faculties = [
+                self.faculties[faculty_id].name
+                for faculty_id in self._faculty_ids[slot]
+                if faculty_id in self.faculties
+            ]
+
+        return {
+            "book_title": book_title,
+            "branch_name": branch_name,
+            "faculties_count": len(faculties),
+            "faculties": faculties,
+        }
+
+    def get_branches(self) -> list:
+        with self._lock:
+            return [self.branches[branch_id] for branch_id in sorted(self.branches)]
+
+    def get_faculties(self) -> list:
+        with self._lock:
+            return [self.faculties[faculty_id] for faculty_id in sorted(self.faculties)]
+
+    def _book_bytes(self) -> int:
+        arrays = (self._book_ids, self._branch_of, self._copies)
+        size = sum(sys.getsizeof(item) for item in arrays)
+        size += sys.getsizeof(self._titles) + sys.getsizeof(self._faculty_ids) + sys.getsizeof(self._slots)
+        size += sum(sys.getsizeof(title) for title in self._titles if title is not None)
+        size += sum(sys.getsizeof(faculty_ids) for faculty_ids in self._faculty_ids if faculty_ids)
+        for titles in self._index.values():
+            size += sys.getsizeof(titles)
+            size += sum(sys.getsizeof(slot) for slot in titles.values() if isinstance(slot, list))
+        return size
+
+    def stats(self) -> dict:
+        with self._lock:
+            books = len(self._slots)
+            book_bytes = self._book_bytes()
+            return {
+                "ready": self.ready,
+                "version": self.version,
+                "branches": len(self.branches),
+                "faculties": len(self.faculties),
+                "books": books,
+                "reloads": self.reloads,
+                "syncs": self.syncs,
+                "book_bytes": book_bytes,
+                "mb_per_million_books": round(book_bytes / books * 1_000_000 / 2**20, 1) if books else None,
+            }
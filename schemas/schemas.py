@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, Field, create_model, field_validator
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 
 class FacultyBase(BaseModel):
@@ -33,9 +35,32 @@ class Branch(BranchBase):
         from_attributes = True
 
 
-class BookBase(BaseModel):
+class WorkBase(BaseModel):
     title: str
     author: str
+
+
+class Work(WorkBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
+class Holding(BaseModel):
+    book_id: int
+    branch_id: Optional[int] = None
+    branch_name: Optional[str] = None
+    copies_available: int
+    students_borrowed_count: int
+
+
+class WorkAvailability(Work):
+    total_copies: int
+    holdings: List[Holding]
+
+
+class BookBase(WorkBase):
     publisher: Optional[str] = None
     year: Optional[int] = None
     pages: Optional[int] = None
@@ -58,12 +83,104 @@ class BookUpdate(BookBase):
 class Book(BookBase):
     id: int
     branch_id: int
+    work_id: Optional[int] = None
     faculties: List[Faculty] = []
 
     class Config:
         from_attributes = True
 
 
+BOOK_FIELDS = tuple(name for name in Book.model_fields if name != "faculties")
+
+
+@lru_cache(maxsize=256)
+def sparse_book_model(fields: Tuple[str, ...], expand_faculties: bool):
+    definitions = {name: (Book.model_fields[name].annotation, Book.model_fields[name]) for name in fields}
+    if expand_faculties:
+        definitions["faculties"] = (List[Faculty], [])
+    return create_model("BookFields", __config__=ConfigDict(from_attributes=True), **definitions)
+
+
+def book_response_model(fields: Optional[Tuple[str, ...]], expand_faculties: bool):
+    if fields is None and expand_faculties:
+        return Book
+    return sparse_book_model(fields or BOOK_FIELDS, expand_faculties)
+
+
+class BookUpsertResult(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    book_ids: List[int]
+
+
+class BookFilter(BaseModel):
+    branch_id: Optional[int] = None
+    author: Optional[str] = None
+    publisher: Optional[str] = None
+    title_pattern: Optional[str] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    in_stock: Optional[bool] = None
+    faculty_id: Optional[int] = None
+
+
+class BookListParams(BookFilter):
+    sort: Optional[str] = None
+    fields: Optional[str] = None
+    expand: Optional[str] = None
+    skip: int = Field(0, ge=0)
+    limit: Optional[int] = Field(None, ge=1, le=1000)
+
+
+class BookPatch(BaseModel):
+    publisher: Optional[str] = None
+    year: Optional[int] = None
+    pages: Optional[int] = None
+    illustrations: Optional[int] = None
+    price: Optional[float] = None
+    price_factor: Optional[float] = Field(None, gt=0)
+    branch_id: Optional[int] = None
+    copies_available: Optional[int] = None
+    students_borrowed_count: Optional[int] = None
+
+    @field_validator("branch_id", "copies_available", "students_borrowed_count")
+    @classmethod
+    def reject_null(cls, value):
+        if value is None:
+            raise ValueError("значение не может быть null")
+        return value
+
+
+class BookBulkUpdate(BaseModel):
+    filter: BookFilter
+    changes: BookPatch
+    dry_run: bool = False
+
+
+class BookBulkDelete(BaseModel):
+    filter: BookFilter
+    dry_run: bool = False
+
+
+class BulkResult(BaseModel):
+    affected: int
+    dry_run: bool
+
+
+class FacultyAssignment(BaseModel):
+    faculty_ids: List[int]
+    book_ids: Optional[List[int]] = None
+    filter: Optional[BookFilter] = None
+
+
+class FacultyAssignmentResult(BaseModel):
+    faculty_ids: List[int]
+    affected: int
+
+
 class BranchBooksCount(BaseModel):
     branch_name: str
     book_title: str
@@ -75,3 +192,99 @@ class BookFacultiesInfo(BaseModel):
     branch_name: str
     faculties_count: int
     faculties: List[str]
+
+
+class FacultyBook(BaseModel):
+    id: int
+    title: str
+    author: str
+    branch_id: Optional[int] = None
+    branch_name: Optional[str] = None
+    copies_available: int
+
+
+class FacultyBooks(BaseModel):
+    faculty_id: int
+    faculty_name: str
+    total_books: int
+    total_copies: int
+    books: List[FacultyBook]
+
+
+class ChangeRecord(BaseModel):
+    seq: int
+    entity: str
+    key: str
+    op: str
+    changed_at: datetime
+    data: Optional[Dict[str, Any]] = None
+
+
+class ChangesPage(BaseModel):
+    changes: List[ChangeRecord]
+    next_token: int
+    has_more: bool
+
+
+class InventoryGroup(BaseModel):
+    key: Optional[Union[int, str]] = None
+    name: Optional[str] = None
+    books: int
+    copies: int
+    inventory_value: float
+    avg_price: Optional[float] = None
+
+
+class InventoryReport(BaseModel):
+    group_by: str
+    total_books: int
+    groups: List[InventoryGroup]
+
+
+class HistogramBin(BaseModel):
+    low: float
+    high: float
+    count: int
+
+
+class DistributionReport(BaseModel):
+    metric: str
+    count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    mean: Optional[float] = None
+    percentiles: Dict[str, float]
+    histogram: List[HistogramBin]
+
+
+class TopBook(BaseModel):
+    book_id: int
+    value: float
+
+
+class TopBooksReport(BaseModel):
+    metric: str
+    books: List[TopBook]
+
+
+class JobCreate(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    params: Dict[str, Any]
+    progress_done: int
+    progress_total: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
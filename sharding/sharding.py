@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, make_url, select, text
+from sqlalchemy.orm import sessionmaker
+
+from models.models import Book
+from migrations.migrations import migrate
+from exceptions.exceptions import ShardPlacementException
+
+SHARD_ID_SPAN = 1 << 24
+
+
+class Shard:
+    def __init__(self, index: int, url: str, **engine_options):
+        self.index = index
+        self.url = make_url(url)
+        self._engine_options = engine_options
+        self._engine = None
+        self._session_factory = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(self.url, **self._engine_options)
+                    self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                    self._engine = engine
+        return self._engine
+
+    @property
+    def session_factory(self):
+        self.engine
+        return self._session_factory
+
+    def dispose(self):
+        with self._lock:
+            engine, self._engine, self._session_factory = self._engine, None, None
+        if engine is not None:
+            engine.dispose()
+
+    @property
+    def first_book_id(self) -> int:
+        return self.index * SHARD_ID_SPAN + 1
+
+    @property
+    def nulls_first(self) -> bool:
+        return self.url.get_backend_name() != "postgresql"
+
+
+def reserve_book_ids(connection, first_id: int):
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('books', 'id'), "
+                "GREATEST(:first_id, (SELECT COALESCE(MAX(id), 0) + 1 FROM books)), false)"
+            ),
+            {"first_id": first_id},
+        )
+    elif connection.dialect.name == "sqlite":
+        last_id = connection.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'books'")).scalar()
+        if last_id is None:
+            statement = "INSERT INTO sqlite_sequence (name, seq) VALUES ('books', :last_id)"
+        elif last_id < first_id - 1:
+            statement = "UPDATE sqlite_sequence SET seq = :last_id WHERE name = 'books'"
+        else:
+            return
+        connection.execute(text(statement), {"last_id": first_id - 1})
+
+
+class ShardMap:
+    """Размещение книг филиалов по базам данных и параллельный опрос шардов"""
+
+    def __init__(self, urls, assignments: dict = None, **engine_options):
+        if not urls:
+            raise ValueError("Не заданы адреса шардов")
+        self.shards = [Shard(index, url, **engine_options) for index, url in enumerate(urls)]
+        self.assignments = dict(assignments or {})
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    @classmethod
+    def from_env(cls, variable: str = "SHARD_DATABASE_URLS", **engine_options):
+        urls = [url.strip() for url in os.environ.get(variable, "").split(",") if url.strip()]
+        return cls(urls, **engine_options) if urls else None
+
+    @property
+    def home(self) -> Shard:
+        return self.shards[0]
+
+    def shard_for_branch(self, branch_id: int = None) -> Shard:
+        if branch_id is None:
+            return self.home
+        return self.shards[self.assignments.get(branch_id, branch_id % len(self.shards))]
+
+    def shard_for_book(self, book_id: int):
+        index = (book_id - 1) // SHARD_ID_SPAN
+        return self.shards[index] if 0 <= index < len(self.shards) else None
+
+    @contextmanager
+    def session(self, shard: Shard):
+        db = shard.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def call(self, shard: Shard, fn):
+        with self.session(shard) as db:
+            return fn(db)
+
+    def run(self, tasks):
+        futures = [self._executor.submit(self.call, shard, fn) for shard, fn in tasks]
+        return [future.result() for future in futures]
+
+    def scatter(self, fn, shards=None):
+        return self.run([(shard, fn) for shard in (self.shards if shards is None else shards)])
+
+    def check_placement(self):
+        # Перенос книг между шардами сменил бы их ID, поэтому при неверном размещении сервис не запускается
+        for shard in self.shards:
+            branch_ids = self.call(
+                shard, lambda db: db.scalars(select(Book.branch_id).distinct().order_by(Book.branch_id)).all()
+            )
+            misplaced = [branch_id for branch_id in branch_ids if self.shard_for_branch(branch_id) is not shard]
+            if misplaced:
+                raise ShardPlacementException(
+                    f"В шарде {shard.index} хранятся книги филиалов {misplaced}, относящихся к другим шардам"
+                )
+
+    def create_all(self):
+        for shard in self.shards:
+            with shard.engine.begin() as connection:
+                migrate(connection)
+                reserve_book_ids(connection, shard.first_book_id)
+
+    def dispose(self):
+        self._executor.shutdown(wait=False)
+        for shard in self.shards:
+            shard.dispose()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, create_engine, func, select, text
+from models.models import Base, Book, Branch, Faculty, Work, book_faculty
+from exceptions.exceptions import SnapshotException
+from migrations.migrations import migrate
+
+MAGIC = b"BKSNAP1\n"
+TRAILER = struct.Struct("<Q8s")
+SNAPSHOT_TABLES = (Branch.__table__, Faculty.__table__, Work.__table__, Book.__table__, book_faculty)
+RESTORE_CHUNK_SIZE = 5000
+SNAPSHOT_ISOLATION = {"postgresql": "REPEATABLE READ", "mysql": "REPEATABLE READ"}
+
+
+def _kind(column) -> str:
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, Float):
+        return "float"
+    if isinstance(column.type, DateTime):
+        return "datetime"
+    return "str"
+
+
+def _encode_column(kind: str, values: list) -> dict:
+    nulls = bytes(value is None for value in values)
+    segments = {"nulls": nulls} if any(nulls) else {}
+
+    if kind in ("int", "bool"):
+        segments["values"] = array("q", (0 if value is None else int(value) for value in values)).tobytes()
+    elif kind == "float":
+        segments["values"] = array("d", (0.0 if value is None else value for value in values)).tobytes()
+    else:
+        if kind == "datetime":
+            values = [None if value is None else value.isoformat() for value in values]
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+        offsets = array("q", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        segments["offsets"] = offsets.tobytes()
+        segments["values"] = b"".join(encoded)
+
+    return segments
+
+
+def _decode_column(kind: str, segments: dict, rows: int, byteorder: str) -> list:
+    if kind in ("int", "bool", "float"):
+        values = array("d" if kind == "float" else "q")
+        values.frombytes(segments["values"])
+        if byteorder != sys.byteorder:
+            values.byteswap()
+        values = values.tolist()
+        if kind == "bool":
+            values = [bool(value) for value in values]
+    else:
+        offsets = array("q")
+        offsets.frombytes(segments["offsets"])
+        if byteorder != sys.byteorder:
+            offsets.byteswap()
+        data = bytes(segments["values"])
+        bounds = offsets.tolist()
+        values = [data[start:end].decode("utf-8") for start, end in zip(bounds[:rows], bounds[1:])]
+        if kind == "datetime":
+            values = [datetime.fromisoformat(value) if value else None for value in values]
+
+    nulls = segments.get("nulls")
+    if nulls is not None:
+        values = [None if is_null else value for value, is_null in zip(values, nulls)]
+    return values
+
+
+def _read_tables(connection):
+    tables = {}
+    for table in SNAPSHOT_TABLES:
+        rows = connection.execute(select(table).order_by(*table.primary_key.columns)).all()
+        tables[table.name] = {column.name: [row[index] for row in rows] for index, column in enumerate(table.columns)}
+    return tables
+
+
+def dump(engine, path: str, compression_level: int = 6) -> dict:
+    isolation_level = SNAPSHOT_ISOLATION.get(engine.dialect.name)
+    with engine.connect() as connection:
+        if isolation_level:
+            connection = connection.execution_options(isolation_level=isolation_level)
+        if engine.dialect.name == "sqlite":
+            connection.exec_driver_sql("BEGIN")
+        tables = _read_tables(connection)
+        connection.rollback()
+
+    footer = {"byteorder": sys.byteorder, "created_at": datetime.now().isoformat(), "tables": {}}
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC)
+        for table in SNAPSHOT_TABLES:
+            columns = tables[table.name]
+            rows = len(next(iter(columns.values())))
+            table_footer = footer["tables"][table.name] = {"rows": rows, "columns": {}}
+            for column in table.columns:
+                kind = _kind(column)
+                segments = {}
+                for name, raw in _encode_column(kind, columns[column.name]).items():
+                    compressed = zlib.compress(raw, compression_level)
+                    segments[name] = [snapshot_file.tell(), len(compressed), len(raw)]
+                    snapshot_file.write(compressed)
+                table_footer["columns"][column.name] = {"kind": kind, "segments": segments}
+
+        footer_offset = snapshot_file.tell()
+        snapshot_file.write(json.dumps(footer).encode("utf-8"))
+        snapshot_file.write(TRAILER.pack(footer_offset, MAGIC))
+
+    return {name: table["rows"] for name, table in footer["tables"].items()}
+
+
+class SnapshotReader:
+    """Чтение снимка через отображение файла в память без загрузки его целиком"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotException(f"Файл '{path}' не является снимком")
+
+        if len(self._map) < len(MAGIC) + TRAILER.size or self._map[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise SnapshotException(f"Файл '{path}' не является снимком")
+        footer_offset, magic = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotException(f"Файл '{path}' повреждён")
+        footer_end = len(self._map) - TRAILER.size
+        self.footer = json.loads(self._map[footer_offset:footer_end])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    @property
+    def tables(self) -> dict:
+        return {name: table["rows"] for name, table in self.footer["tables"].items()}
+
+    def columns(self, table: str) -> list:
+        return list(self.footer["tables"][table]["columns"])
+
+    def column(self, table: str, name: str) -> list:
+        table_footer = self.footer["tables"][table]
+        column = table_footer["columns"][name]
+        with memoryview(self._map) as view:
+            segments = {
+                segment: zlib.decompress(view[offset:][:length], bufsize=raw_length)
+                for segment, (offset, length, raw_length) in column["segments"].items()
+            }
+        return _decode_column(column["kind"], segments, table_footer["rows"], self.footer["byteorder"])
+
+    def rows(self, table: str, columns=None):
+        names = columns or self.columns(table)
+        return [dict(zip(names, values)) for values in zip(*(self.column(table, name) for name in names))]
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, table in self.footer["tables"].items():
+            segments = [segment for column in table["columns"].values() for segment in column["segments"].values()]
+            stats[name] = {
+                "rows": table["rows"],
+                "compressed_bytes": sum(length for _, length, _ in segments),
+                "raw_bytes": sum(raw_length for _, _, raw_length in segments),
+            }
+        return stats
+
+
+def _subset(reader: SnapshotReader, table: str, keep: dict) -> list:
+    rows = reader.rows(table)
+    for name, allowed in keep.items():
+        rows = [row for row in rows if row[name] in allowed]
+    return rows
+
+
+def _snapshot_rows(reader: SnapshotReader, branch_ids=None) -> dict:
+    if branch_ids is None:
+        return {table.name: reader.rows(table.name) for table in SNAPSHOT_TABLES}
+
+    branch_ids = set(branch_ids)
+    books = _subset(reader, Book.__tablename__, {"branch_id": branch_ids})
+    book_ids = {book["id"] for book in books}
+    work_ids = {book["work_id"] for book in books}
+    return {
+        Branch.__tablename__: _subset(reader, Branch.__tablename__, {"id": branch_ids}),
+        Faculty.__tablename__: reader.rows(Faculty.__tablename__),
+        Work.__tablename__: _subset(reader, Work.__tablename__, {"id": work_ids}),
+        Book.__tablename__: books,
+        book_faculty.name: _subset(reader, book_faculty.name, {"book_id": book_ids}),
+    }
+
+
+def _reset_sequences(connection):
+    if connection.dialect.name != "postgresql":
+        return
+    for table in SNAPSHOT_TABLES:
+        if "id" in table.columns:
+            sequence = f"pg_get_serial_sequence('{table.name}', 'id')"
+            connection.execute(text(f"SELECT setval({sequence}, COALESCE(MAX(id), 0) + 1, false) FROM {table.name}"))
+
+
+def restore(engine, path: str, branch_ids=None) -> dict:
+    Base.metadata.create_all(bind=engine)
+
+    with SnapshotReader(path) as reader:
+        data = _snapshot_rows(reader, branch_ids)
+
+    with engine.begin() as connection:
+        for table in SNAPSHOT_TABLES:
+            if connection.execute(select(func.count()).select_from(table)).scalar():
+                raise SnapshotException(f"Таблица '{table.name}' в целевой базе данных не пуста")
+
+        for table in SNAPSHOT_TABLES:
+            rows = data[table.name]
+            for start in range(0, len(rows), RESTORE_CHUNK_SIZE):
+                end = start + RESTORE_CHUNK_SIZE
+                connection.execute(table.insert(), rows[start:end])
+
+        _reset_sequences(connection)
+        migrate(connection)
+
+    return {name: len(rows) for name, rows in data.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Снимок библиотеки: сохранение, восстановление и просмотр")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = commands.add_parser("dump", help="сохранить снимок базы данных в файл")
+    dump_parser.add_argument("path")
+    dump_parser.add_argument("--url", help="адрес базы данных (по умолчанию из db.database)")
+
+    restore_parser = commands.add_parser("restore", help="загрузить снимок в пустую базу данных")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--url", help="адрес базы данных (по умолчанию из db.database)")
+    restore_parser.add_argument(
+        "--branch", type=int, action="append", dest="branch_ids", help="загрузить только филиал"
+    )
+
+    inspect_parser = commands.add_parser("inspect", help="показать состав снимка")
+    inspect_parser.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "inspect":
+        with SnapshotReader(args.path) as reader:
+            print(json.dumps(reader.stats(), ensure_ascii=False, indent=2))
+        return
+
+    if args.url:
+        engine = create_engine(args.url)
+    else:
+        from db.database import engine
+
+    if args.command == "dump":
+        counts = dump(engine, args.path)
+    else:
+        counts = restore(engine, args.path, args.branch_ids)
+    print(json.dumps(counts, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
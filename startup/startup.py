@@ -0,0 +1,49 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+IMPORT_STARTED = time.perf_counter()
+
+
+def _elapsed_ms(started: float, finished: float) -> float:
+    return round((finished - started) * 1000, 3)
+
+
+class StartupProfile:
+    """Замеры времени фаз запуска: импорт, проверка БД и прогрев"""
+
+    def __init__(self, started: float = IMPORT_STARTED):
+        self.started = started
+        self.phases = {}
+        self.tasks = {}
+        self.finished = None
+
+    def mark(self, name: str, since: float = None):
+        self.phases[name] = _elapsed_ms(self.started if since is None else since, time.perf_counter())
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name, started)
+            self.finished = time.perf_counter()
+
+    async def warm_up(self, tasks: dict):
+        async def run(name, fn):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(fn)
+            finally:
+                self.tasks[name] = _elapsed_ms(started, time.perf_counter())
+
+        async with self.phase("warm_up"):
+            await asyncio.gather(*(run(name, fn) for name, fn in tasks.items()))
+
+    def report(self) -> dict:
+        return {
+            "phases_ms": dict(self.phases),
+            "warm_up_tasks_ms": dict(self.tasks),
+            "total_ms": _elapsed_ms(self.started, self.finished) if self.finished is not None else None,
+        }
@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.event import listen
+from sqlalchemy.orm import sessionmaker
+from models.models import Base
+from schemas.schemas import (
+    BookBulkDelete,
+    BookBulkUpdate,
+    BookCreate,
+    BookFilter,
+    BookPatch,
+    BranchCreate,
+    FacultyAssignment,
+    FacultyCreate,
+)
+from exceptions.exceptions import InvalidReportException
+from analytics.analytics import BookAnalytics, parse_percentiles
+import crud.crud as crud
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def catalog(db_session):
+    main_branch = crud.create_branch(db_session, BranchCreate(name="Main"))
+    north = crud.create_branch(db_session, BranchCreate(name="North"))
+    physics = crud.create_faculty(db_session, FacultyCreate(name="Physics"))
+    records = [
+        BookCreate(
+            title="Optics",
+            author="Newton",
+            publisher="Royal",
+            year=1704,
+            price=10.0,
+            branch_id=main_branch.id,
+            copies_available=4,
+            students_borrowed_count=2,
+            faculty_ids=[physics.id],
+        ),
+        BookCreate(
+            title="Principia",
+            author="Newton",
+            publisher="Royal",
+            year=1687,
+            price=30.0,
+            branch_id=north.id,
+            copies_available=1,
+            students_borrowed_count=3,
+            faculty_ids=[physics.id],
+        ),
+        BookCreate(title="Elements", author="Euclid", year=1482, price=5.0, branch_id=north.id, copies_available=2),
+        BookCreate(title="Almagest", author="Ptolemy", branch_id=main_branch.id),
+    ]
+    books = [crud.create_book(db_session, record) for record in records]
+    return main_branch, north, physics, books
+
+
+def analytics(db_session):
+    book_analytics = BookAnalytics(min_refresh_interval=0)
+    book_analytics.refresh(db_session)
+    return book_analytics
+
+
+class TestBookAnalytics:
+    def test_inventory_groups_by_dictionary_encoded_columns(self, db_session, catalog):
+        main_branch, north, physics, books = catalog
+        book_analytics = analytics(db_session)
+
+        by_branch = book_analytics.inventory("branch")
+        assert by_branch["total_books"] == 4
+        assert [
+            (group["name"], group["books"], group["copies"], group["inventory_value"], group["avg_price"])
+            for group in by_branch["groups"]
+        ] == [("Main", 2, 4, 40.0, 10.0), ("North", 2, 3, 40.0, 17.5)]
+
+        by_publisher = book_analytics.inventory("publisher", branch_id=north.id)
+        assert [(group["key"], group["books"]) for group in by_publisher["groups"]] == [("Royal", 1), (None, 1)]
+
+        by_faculty = book_analytics.inventory("faculty")
+        assert [(group["name"], group["books"], group["copies"]) for group in by_faculty["groups"]] == [
+            ("Physics", 2, 5)
+        ]
+        assert [group["key"] for group in book_analytics.inventory("year", limit=2)["groups"]] == [1704, 1687]
+
+    def test_distribution_and_top_books(self, db_session, catalog):
+        main_branch, north, physics, books = catalog
+        book_analytics = analytics(db_session)
+
+        prices = book_analytics.distribution("price", percentiles=(50,), bins=5)
+        assert prices["count"] == 3
+        assert (prices["min"], prices["max"], prices["percentiles"]) == (5.0, 30.0, {"50": 10.0})
+        assert sum(item["count"] for item in prices["histogram"]) == 3
+
+        rates = book_analytics.distribution("borrow_rate", percentiles=(100,), faculty_id=physics.id)
+        assert (rates["count"], rates["percentiles"]) == (2, {"100": 3.0})
+
+        top = book_analytics.top_books("inventory_value", n=2)
+        assert [item["book_id"] for item in top["books"]] == [books[0].id, books[1].id]
+
+        with pytest.raises(InvalidReportException):
+            book_analytics.top_books("pages")
+        with pytest.raises(InvalidReportException):
+            book_analytics.inventory("author")
+        with pytest.raises(InvalidReportException):
+            parse_percentiles("50,101")
+
+    def test_refresh_applies_change_log_incrementally(self, db_session, catalog):
+        main_branch, north, physics, books = catalog
+        book_analytics = analytics(db_session)
+        records = [
+            BookCreate(title=f"Book {index}", author="Author", price=1.0, branch_id=north.id, copies_available=1)
+            for index in range(60)
+        ]
+        for record in records:
+            crud.create_book(db_session, record)
+        book_analytics.refresh(db_session)
+        assert book_analytics.full_loads == 2
+
+        elements = BookFilter(title_pattern="Elements")
+        crud.update_books(db_session, BookBulkUpdate(filter=elements, changes=BookPatch(price=50.0)))
+        crud.assign_faculties(db_session, FacultyAssignment(faculty_ids=[physics.id], filter=elements))
+        crud.delete_book(db_session, books[0].id)
+        crud.delete_books(db_session, BookBulkDelete(filter=BookFilter(title_pattern="Book 1")))
+        crud.create_book(db_session, BookCreate(title="Late", author="Author", branch_id=main_branch.id))
+        book_analytics.refresh(db_session)
+
+        assert book_analytics.full_loads == 2
+        assert book_analytics.incremental_refreshes == 1
+        assert book_analytics.stats()["rows"] == 63
+        assert book_analytics.top_books("price", n=1)["books"] == [{"book_id": books[2].id, "value": 50.0}]
+        assert book_analytics.inventory("faculty")["groups"][0]["books"] == 2
+        assert book_analytics.inventory("branch", branch_id=main_branch.id)["total_books"] == 2
+
+        fresh = analytics(db_session)
+        for group_by in ("branch", "publisher", "year", "faculty"):
+            assert book_analytics.inventory(group_by) == fresh.inventory(group_by)
+
+    def test_refresh_queries_do_not_block_reports(self, db_session, catalog):
+        main_branch, north, physics, books = catalog
+        book_analytics = analytics(db_session)
+        crud.update_books(db_session, BookBulkUpdate(filter=BookFilter(author="Euclid"), changes=BookPatch(price=7.0)))
+        report_lock_free = []
+
+        def probe(*args):
+            def try_lock():
+                acquired = book_analytics._lock.acquire(blocking=False)
+                if acquired:
+                    book_analytics._lock.release()
+                report_lock_free.append(acquired)
+
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+
+        listen(db_session.get_bind(), "before_cursor_execute", probe)
+        book_analytics.refresh(db_session, force=True)
+        book_analytics.load(db_session)
+
+        assert report_lock_free and all(report_lock_free)
+        assert book_analytics.top_books("price", n=1, branch_id=north.id)["books"][0]["value"] == 30.0
+        assert book_analytics.distribution("price", percentiles=(0,))["percentiles"] == {"0": 7.0}
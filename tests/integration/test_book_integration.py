@@ -1,15 +1,26 @@
 import pytest
-from sqlalchemy import create_engine
+from pydantic import ValidationError
+from sqlalchemy import create_engine, update
+from sqlalchemy.event import listen
 from sqlalchemy.orm import sessionmaker
 from db.database import Base
-from models.models import Branch, Faculty
-from schemas.schemas import BookCreate, BranchCreate, FacultyCreate
-from exceptions.exceptions import DuplicateBookException
+from models.models import Branch, Change, Faculty
+from schemas.schemas import (
+    BookBulkDelete, BookBulkUpdate, BookCreate, BookFilter, BookPatch, BookUpdate,
+    BranchCreate, FacultyAssignment, FacultyCreate
+)
+from exceptions.exceptions import (
+    BookNotFoundException, BranchNotFoundException, DuplicateBookException, FacultyNotFoundException,
+    InvalidBookDataException
+)
 from crud.crud import (
-    get_book, get_books, create_book, delete_book,
+    get_book, get_books, create_book, update_book, delete_book,
     get_branch, get_branches, create_branch,
     create_faculty, get_faculties, get_book_copies_in_branch,
-    get_book_faculties_in_branch
+    get_book_faculties_in_branch, get_faculty_books,
+    assign_faculties, remove_faculties,
+    get_works, get_work_availability, parse_book_fieldset,
+    update_books, delete_books, upsert_books, get_changes, _record_changes
 )
 
 
@@ -101,6 +112,18 @@ class TestBookIntegration:
         with pytest.raises(DuplicateBookException):
             create_book(db_session, book_data)
 
+    def test_update_book_to_existing_title_raises_exception(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        db_session.add(branch)
+        db_session.commit()
+
+        create_book(db_session, BookCreate(title="Optics", author="Newton", branch_id=branch.id))
+        other = create_book(db_session, BookCreate(title="Opticks", author="Newton", branch_id=branch.id))
+
+        with pytest.raises(DuplicateBookException):
+            update_book(db_session, other.id, BookUpdate(title="Optics", author="Newton"))
+        assert update_book(db_session, other.id, BookUpdate(title="Opticks", author="Newton", price=5.0)).price == 5.0
+
     def test_delete_book(self, db_session):
         branch = Branch(name="Main Branch", address="123 Main St")
         db_session.add(branch)
@@ -152,6 +175,76 @@ class TestBookIntegration:
         assert "Book 2" in titles
 
 
+    def test_get_books_with_filters_sort_and_pagination(self, db_session):
+        main_branch = Branch(name="Main Branch", address="123 Main St")
+        east_branch = Branch(name="East Branch", address="1 East St")
+        faculty = Faculty(name="Physics")
+        db_session.add_all([main_branch, east_branch, faculty])
+        db_session.commit()
+
+        for title, branch, year, price, copies in [
+            ("Optics", main_branch, 1704, 30.0, 2),
+            ("Principia", main_branch, 1687, 50.0, 0),
+            ("Elements", main_branch, 1956, 10.0, 4),
+            ("Optics", east_branch, 1704, 35.0, 1),
+        ]:
+            create_book(db_session, BookCreate(
+                title=title,
+                author="Newton" if title != "Elements" else "Euclid",
+                branch_id=branch.id,
+                year=year,
+                price=price,
+                copies_available=copies,
+                faculty_ids=[faculty.id] if title == "Optics" else None
+            ))
+
+        in_stock = get_books(db_session, BookFilter(branch_id=main_branch.id, in_stock=True), sort="-price")
+        assert [book.title for book in in_stock] == ["Optics", "Elements"]
+
+        ranged = get_books(db_session, BookFilter(year_min=1700, price_max=32.0), sort="year")
+        assert [book.title for book in ranged] == ["Optics", "Elements"]
+
+        by_faculty = get_books(db_session, BookFilter(faculty_id=faculty.id))
+        assert {book.branch_id for book in by_faculty} == {main_branch.id, east_branch.id}
+
+        page = get_books(db_session, BookFilter(author="Newton"), sort="title,-price", skip=1, limit=2)
+        assert [(book.title, book.price) for book in page] == [("Optics", 30.0), ("Principia", 50.0)]
+
+        with pytest.raises(InvalidBookDataException):
+            get_books(db_session, BookFilter(), sort="pages")
+
+
+    def test_get_books_sparse_fieldset_narrows_select(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        faculty = Faculty(name="Physics")
+        db_session.add_all([branch, faculty])
+        db_session.commit()
+        create_book(
+            db_session, BookCreate(title="Optics", author="Newton", branch_id=branch.id, faculty_ids=[faculty.id])
+        )
+        db_session.expunge_all()
+
+        statements = []
+        listen(db_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        fields, expand_faculties = parse_book_fieldset("title,copies_available")
+        books = get_books(db_session, fields=fields, expand_faculties=expand_faculties)
+
+        assert set(fields) == {"id", "title", "copies_available"}
+        assert [book.title for book in books] == ["Optics"]
+        assert len(statements) == 1
+        assert "publisher" not in statements[0]
+        assert "book_faculty" not in statements[0]
+
+        statements.clear()
+        db_session.expunge_all()
+        fields, expand_faculties = parse_book_fieldset("title", "faculties")
+        books = get_books(db_session, fields=fields, expand_faculties=expand_faculties)
+
+        assert [faculty.name for faculty in books[0].faculties] == ["Physics"]
+        assert len(statements) == 2
+
+
 class TestBranchIntegration:
     def test_create_and_get_branch(self, db_session):
         branch_data = BranchCreate(name="Test Branch", address="Test Address")
@@ -230,4 +323,344 @@ class TestBookQueriesIntegration:
         assert result["branch_name"] == "Main Branch"
         assert result["faculties_count"] == 2
         assert "Science" in result["faculties"]
-        assert "Engineering" in result["faculties"]
\ No newline at end of file
+        assert "Engineering" in result["faculties"]
+
+class TestFacultyBooksIntegration:
+    def test_get_faculty_books_with_totals_and_branch_filter(self, db_session):
+        main_branch = Branch(name="Main Branch", address="123 Main St")
+        east_branch = Branch(name="East Branch", address="1 East St")
+        faculty = Faculty(name="Physics")
+        db_session.add_all([main_branch, east_branch, faculty])
+        db_session.commit()
+
+        for title, branch, copies in [
+            ("Optics", main_branch, 2),
+            ("Mechanics", main_branch, 3),
+            ("Optics", east_branch, 4),
+        ]:
+            create_book(db_session, BookCreate(
+                title=title,
+                author="Author",
+                branch_id=branch.id,
+                copies_available=copies,
+                faculty_ids=[faculty.id]
+            ))
+        create_book(db_session, BookCreate(title="Unrelated", author="Author", branch_id=main_branch.id))
+
+        result = get_faculty_books(db_session, faculty.id, limit=2)
+
+        assert result["faculty_name"] == "Physics"
+        assert result["total_books"] == 3
+        assert result["total_copies"] == 9
+        assert [book["title"] for book in result["books"]] == ["Mechanics", "Optics"]
+
+        result = get_faculty_books(db_session, faculty.id, branch_id=east_branch.id)
+
+        assert result["total_books"] == 1
+        assert result["books"][0]["branch_name"] == "East Branch"
+
+        result = get_faculty_books(db_session, faculty.id, skip=10)
+
+        assert result["books"] == []
+        assert result["total_books"] == 3
+
+    def test_get_faculty_books_faculty_not_found(self, db_session):
+        with pytest.raises(FacultyNotFoundException):
+            get_faculty_books(db_session, 999)
+
+
+class TestFacultyAssignmentIntegration:
+    def test_assign_faculties_by_filter_is_idempotent(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        physics = Faculty(name="Physics")
+        chemistry = Faculty(name="Chemistry")
+        db_session.add_all([branch, physics, chemistry])
+        db_session.commit()
+
+        create_book(
+            db_session, BookCreate(title="Intro to Optics", author="A", branch_id=branch.id, faculty_ids=[physics.id])
+        )
+        create_book(db_session, BookCreate(title="Intro to Acids", author="A", branch_id=branch.id))
+        create_book(db_session, BookCreate(title="History", author="B", branch_id=branch.id))
+
+        assignment = FacultyAssignment(
+            faculty_ids=[physics.id, chemistry.id],
+            filter=BookFilter(author="A", title_pattern="Intro%"),
+        )
+
+        assert assign_faculties(db_session, assignment)["affected"] == 3
+        assert assign_faculties(db_session, assignment)["affected"] == 0
+        assert get_faculty_books(db_session, chemistry.id)["total_books"] == 2
+        assert get_faculty_books(db_session, physics.id)["total_books"] == 2
+
+    def test_remove_faculties_by_book_ids(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        physics = Faculty(name="Physics")
+        db_session.add_all([branch, physics])
+        db_session.commit()
+
+        first = create_book(
+            db_session, BookCreate(title="First", author="A", branch_id=branch.id, faculty_ids=[physics.id])
+        )
+        create_book(db_session, BookCreate(title="Second", author="A", branch_id=branch.id, faculty_ids=[physics.id]))
+
+        result = remove_faculties(db_session, FacultyAssignment(faculty_ids=[physics.id], book_ids=[first.id]))
+
+        assert result["affected"] == 1
+        assert [book["title"] for book in get_faculty_books(db_session, physics.id)["books"]] == ["Second"]
+
+    def test_assign_faculties_requires_book_selection(self, db_session):
+        faculty = Faculty(name="Physics")
+        db_session.add(faculty)
+        db_session.commit()
+
+        with pytest.raises(InvalidBookDataException):
+            assign_faculties(db_session, FacultyAssignment(faculty_ids=[faculty.id]))
+
+    def test_assign_unknown_faculty(self, db_session):
+        with pytest.raises(FacultyNotFoundException):
+            assign_faculties(db_session, FacultyAssignment(faculty_ids=[999], book_ids=[1]))
+
+
+class TestWorkIntegration:
+    def test_copies_in_branches_share_one_work(self, db_session):
+        main_branch = Branch(name="Main Branch", address="123 Main St")
+        east_branch = Branch(name="East Branch", address="1 East St")
+        db_session.add_all([main_branch, east_branch])
+        db_session.commit()
+
+        first = create_book(
+            db_session, BookCreate(title="Optics", author="Newton", branch_id=main_branch.id, copies_available=2)
+        )
+        second = create_book(
+            db_session, BookCreate(title="Optics", author="Newton", branch_id=east_branch.id, copies_available=5)
+        )
+
+        assert first.work_id is not None
+        assert first.work_id == second.work_id
+        assert [work.id for work in get_works(db_session, title="Optics")] == [first.work_id]
+
+        availability = get_work_availability(db_session, first.work_id)
+
+        assert availability["total_copies"] == 7
+        assert [holding["branch_name"] for holding in availability["holdings"]] == ["Main Branch", "East Branch"]
+
+    def test_update_book_title_rebinds_work(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        db_session.add(branch)
+        db_session.commit()
+
+        book = create_book(db_session, BookCreate(title="Optics", author="Newton", branch_id=branch.id))
+        old_work_id = book.work_id
+        updated = update_book(db_session, book.id, BookUpdate(title="Opticks", author="Newton"))
+
+        assert updated.work_id != old_work_id
+        assert updated.work.title == "Opticks"
+        assert [work.title for work in get_works(db_session)] == ["Opticks"]
+
+    def test_deleting_last_holding_removes_work(self, db_session):
+        main_branch, east_branch = Branch(name="Main Branch"), Branch(name="East Branch")
+        db_session.add_all([main_branch, east_branch])
+        db_session.commit()
+
+        first = create_book(db_session, BookCreate(title="Optics", author="Newton", branch_id=main_branch.id))
+        create_book(db_session, BookCreate(title="Optics", author="Newton", branch_id=east_branch.id))
+        create_book(db_session, BookCreate(title="Elements", author="Euclid", branch_id=east_branch.id))
+
+        delete_book(db_session, first.id)
+        assert [work.title for work in get_works(db_session)] == ["Elements", "Optics"]
+        delete_books(db_session, BookBulkDelete(filter=BookFilter(branch_id=east_branch.id)))
+        assert get_works(db_session) == []
+
+    def test_work_availability_not_found(self, db_session):
+        with pytest.raises(BookNotFoundException):
+            get_work_availability(db_session, 999)
+
+
+class TestBulkBookOperationsIntegration:
+    @pytest.fixture
+    def catalog(self, db_session):
+        main_branch = Branch(name="Main Branch", address="123 Main St")
+        closed_branch = Branch(name="Closed Branch", address="1 Old St")
+        faculty = Faculty(name="Physics")
+        db_session.add_all([main_branch, closed_branch, faculty])
+        db_session.commit()
+
+        for title, publisher, branch, price in [
+            ("Optics", "Royal Society", main_branch, 10.0),
+            ("Principia", "Royal Society", closed_branch, 20.0),
+            ("Elements", "Alexandria", closed_branch, 30.0),
+        ]:
+            create_book(db_session, BookCreate(
+                title=title,
+                author="Author",
+                publisher=publisher,
+                price=price,
+                branch_id=branch.id,
+                faculty_ids=[faculty.id]
+            ))
+
+        return main_branch, closed_branch, faculty
+
+    def test_update_books_reprices_by_publisher(self, db_session, catalog):
+        bulk = BookBulkUpdate(filter=BookFilter(publisher="Royal Society"), changes=BookPatch(price_factor=1.1))
+
+        assert update_books(db_session, bulk.model_copy(update={"dry_run": True})) == {"affected": 2, "dry_run": True}
+        assert update_books(db_session, bulk) == {"affected": 2, "dry_run": False}
+
+        db_session.expire_all()
+        prices = {book.title: book.price for book in get_books(db_session)}
+        assert prices == {"Optics": pytest.approx(11.0), "Principia": pytest.approx(22.0), "Elements": 30.0}
+
+    def test_delete_books_of_closed_branch_clears_faculty_links(self, db_session, catalog):
+        _, closed_branch, faculty = catalog
+        bulk = BookBulkDelete(filter=BookFilter(branch_id=closed_branch.id))
+
+        assert delete_books(db_session, bulk) == {"affected": 2, "dry_run": False}
+
+        assert [book.title for book in get_books(db_session)] == ["Optics"]
+        assert get_faculty_books(db_session, faculty.id)["total_books"] == 1
+
+    def test_delete_books_by_faculty(self, db_session, catalog):
+        _, _, faculty = catalog
+
+        assert delete_books(db_session, BookBulkDelete(filter=BookFilter(faculty_id=faculty.id)))["affected"] == 3
+        assert get_books(db_session) == []
+
+    def test_bulk_operations_require_filter_and_changes(self, db_session, catalog):
+        with pytest.raises(InvalidBookDataException):
+            delete_books(db_session, BookBulkDelete(filter=BookFilter()))
+        with pytest.raises(InvalidBookDataException):
+            update_books(db_session, BookBulkUpdate(filter=BookFilter(author="Author"), changes=BookPatch()))
+        with pytest.raises(BranchNotFoundException):
+            update_books(
+                db_session, BookBulkUpdate(filter=BookFilter(author="Author"), changes=BookPatch(branch_id=999))
+            )
+        for field in ("branch_id", "copies_available", "students_borrowed_count"):
+            with pytest.raises(ValidationError):
+                BookPatch(**{field: None})
+
+    def test_update_books_rejects_move_that_creates_duplicates(self, db_session, catalog):
+        main_branch, closed_branch, _ = catalog
+        create_book(db_session, BookCreate(title="Elements", author="Author", branch_id=main_branch.id))
+        to_main = BookPatch(branch_id=main_branch.id)
+
+        with pytest.raises(DuplicateBookException):
+            update_books(db_session, BookBulkUpdate(filter=BookFilter(branch_id=closed_branch.id), changes=to_main))
+        with pytest.raises(DuplicateBookException):
+            update_books(db_session, BookBulkUpdate(filter=BookFilter(title_pattern="Elements"), changes=to_main))
+
+        move_principia = BookBulkUpdate(filter=BookFilter(title_pattern="Principia"), changes=to_main)
+        assert update_books(db_session, move_principia)["affected"] == 1
+        stay = BookBulkUpdate(filter=BookFilter(branch_id=main_branch.id), changes=to_main)
+        assert update_books(db_session, stay)["affected"] == 3
+
+
+class TestUpsertBooksIntegration:
+    def test_upsert_reports_inserted_updated_and_unchanged(self, db_session):
+        branch = Branch(name="Main Branch", address="123 Main St")
+        physics = Faculty(name="Physics")
+        chemistry = Faculty(name="Chemistry")
+        db_session.add_all([branch, physics, chemistry])
+        db_session.commit()
+
+        records = [
+            BookCreate(
+                title="Optics", author="Newton", branch_id=branch.id, copies_available=2, faculty_ids=[physics.id]
+            ),
+            BookCreate(title="Principia", author="Newton", branch_id=branch.id, copies_available=1),
+        ]
+        first = upsert_books(db_session, records)
+
+        assert (first["inserted"], first["updated"], first["unchanged"]) == (2, 0, 0)
+
+        records = [
+            BookCreate(
+                title="Optics", author="Newton", branch_id=branch.id, copies_available=2, faculty_ids=[chemistry.id]
+            ),
+            BookCreate(title="Principia", author="Newton", branch_id=branch.id, copies_available=5),
+            BookCreate(title="Elements", author="Euclid", branch_id=branch.id),
+        ]
+        second = upsert_books(db_session, records)
+
+        assert (second["inserted"], second["updated"], second["unchanged"]) == (1, 2, 0)
+        assert second["book_ids"][:2] == first["book_ids"]
+
+        third = upsert_books(db_session, records)
+
+        assert (third["inserted"], third["updated"], third["unchanged"]) == (0, 0, 3)
+
+        db_session.expire_all()
+        optics = get_book(db_session, first["book_ids"][0])
+        assert [faculty.name for faculty in optics.faculties] == ["Chemistry"]
+        assert get_book(db_session, first["book_ids"][1]).copies_available == 5
+        assert get_works(db_session, title="Elements")[0].id == get_book(db_session, second["book_ids"][2]).work_id
+
+    def test_upsert_unknown_branch(self, db_session):
+        with pytest.raises(BranchNotFoundException):
+            upsert_books(db_session, [BookCreate(title="Optics", author="Newton", branch_id=999)])
+
+
+class TestChangesIntegration:
+    def test_changes_since_token_collapses_and_tombstones(self, db_session):
+        branch = create_branch(db_session, BranchCreate(name="Main Branch"))
+        physics = create_faculty(db_session, FacultyCreate(name="Physics"))
+        optics = create_book(
+            db_session, BookCreate(title="Optics", author="Newton", branch_id=branch.id, faculty_ids=[physics.id])
+        )
+        principia = create_book(db_session, BookCreate(title="Principia", author="Newton", branch_id=branch.id))
+
+        first = get_changes(db_session, since=0, limit=3)
+
+        assert first["has_more"]
+        assert [(change["entity"], change["op"]) for change in first["changes"]] == [
+            ("branches", "insert"), ("faculties", "insert"), ("books", "insert")
+        ]
+        assert first["changes"][2]["data"]["title"] == "Optics"
+
+        update_book(db_session, principia.id, BookUpdate(title="Principia", author="Newton", copies_available=4))
+        delete_book(db_session, optics.id)
+
+        second = get_changes(db_session, since=first["next_token"])
+
+        assert not second["has_more"]
+        assert [(change["entity"], change["key"], change["op"]) for change in second["changes"]] == [
+            ("books", str(principia.id), "update"),
+            ("book_faculty", f"{optics.id}:{physics.id}", "delete"),
+            ("books", str(optics.id), "delete"),
+        ]
+        assert second["changes"][0]["data"]["copies_available"] == 4
+        assert [change["data"] for change in second["changes"][1:]] == [None, None]
+
+        assert get_changes(db_session, since=second["next_token"]) == {
+            "changes": [], "next_token": second["next_token"], "has_more": False
+        }
+
+    def test_bulk_writes_are_recorded(self, db_session):
+        branch = create_branch(db_session, BranchCreate(name="Main Branch"))
+        upsert_books(db_session, [BookCreate(title="Optics", author="Newton", branch_id=branch.id, publisher="Old")])
+        token = get_changes(db_session)["next_token"]
+
+        update_books(db_session, BookBulkUpdate(filter=BookFilter(publisher="Old"), changes=BookPatch(publisher="New")))
+
+        changes = get_changes(db_session, since=token)["changes"]
+        assert [(change["entity"], change["op"], change["data"]["publisher"]) for change in changes] == [
+            ("books", "update", "New")
+        ]
+        assert changes[0]["data"]["updated_at"] is not None
+
+    def test_changes_get_seqs_at_commit(self, db_session):
+        branch = create_branch(db_session, BranchCreate(name="Main Branch"))
+        token = get_changes(db_session)["next_token"]
+
+        db_session.execute(update(Branch).where(Branch.id == branch.id).values(address="Old"))
+        _record_changes(db_session, "branches", "update", [branch.id])
+        assert db_session.query(Change).filter(Change.seq > token).count() == 0
+        db_session.rollback()
+
+        db_session.execute(update(Branch).where(Branch.id == branch.id).values(address="New"))
+        _record_changes(db_session, "branches", "update", [branch.id])
+        db_session.commit()
+
+        page = get_changes(db_session, since=token)
+        assert [(change["seq"], change["data"]["address"]) for change in page["changes"]] == [(token + 1, "New")]
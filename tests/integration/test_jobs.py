@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from models.models import Branch, Job
+from schemas.schemas import JobCreate
+from exceptions.exceptions import InvalidJobException, JobNotFoundException
+from jobs.jobs import JOB_HANDLERS, JobHandler, JobRunner
+import jobs.jobs as jobs
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        engine.dispose()
+
+
+def wait_for(session_factory, job_id, statuses=("succeeded", "failed", "cancelled"), timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with session_factory() as db:
+            job = db.get(Job, job_id)
+            if job.status in statuses:
+                return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+
+def blocking_handlers(release):
+    def block(db, context, steps=1):
+        for step in range(steps):
+            release.wait(5)
+            context.progress(step + 1, steps)
+        return {"steps": steps}
+
+    return {"block": JobHandler(block, max_concurrency=1)}
+
+
+class TestJobRunner:
+    def test_import_and_export_books(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.setattr(jobs, "EXPORT_DIR", str(tmp_path / "exports"))
+        with session_factory() as db:
+            db.add(Branch(name="Main Branch"))
+            db.commit()
+
+        runner = JobRunner(session_factory, handlers=JOB_HANDLERS)
+        records = [{"title": f"Book {i}", "author": "Author", "branch_id": 1} for i in range(3)]
+        try:
+            with session_factory() as db:
+                imported = runner.submit(db, JobCreate(kind="import_books", params={"books": records + records[:1]}))
+            job = wait_for(session_factory, imported.id)
+
+            assert job.status == "succeeded"
+            assert job.result == {"created": 3, "skipped": 1}
+            assert job.progress_done == job.progress_total == 4
+
+            with session_factory() as db:
+                exported = runner.submit(db, JobCreate(kind="export_books", params={"chunk_size": 2}))
+            job = wait_for(session_factory, exported.id)
+            path = str(tmp_path / "exports" / f"books-{exported.id}.jsonl")
+
+            assert job.result == {"path": path, "rows": 3}
+            with open(path, encoding="utf-8") as export_file:
+                assert [json.loads(line)["title"] for line in export_file] == ["Book 0", "Book 1", "Book 2"]
+        finally:
+            runner.shutdown(wait=True)
+
+    def test_export_rejects_client_path(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.setattr(jobs, "EXPORT_DIR", str(tmp_path / "exports"))
+        runner = JobRunner(session_factory, handlers=JOB_HANDLERS)
+        target = tmp_path / "outside.jsonl"
+        try:
+            with session_factory() as db:
+                with pytest.raises(InvalidJobException):
+                    runner.submit(db, JobCreate(kind="export_books", params={"path": "../outside.jsonl"}))
+                with pytest.raises(InvalidJobException):
+                    runner.submit(db, JobCreate(kind="export_books", params={"path": str(target)}))
+                assert db.query(Job).count() == 0
+        finally:
+            runner.shutdown(wait=True)
+        assert not target.exists()
+
+    def test_per_kind_concurrency_and_cancel(self, session_factory):
+        release = threading.Event()
+        runner = JobRunner(session_factory, handlers=blocking_handlers(release))
+        try:
+            with session_factory() as db:
+                first, second, third = (
+                    runner.submit(db, job).id
+                    for job in [
+                        JobCreate(kind="block", params={"steps": 3}),
+                        JobCreate(kind="block"),
+                        JobCreate(kind="block"),
+                    ]
+                )
+
+            wait_for(session_factory, first, statuses=("running",))
+            with session_factory() as db:
+                assert db.get(Job, second).status == "queued"
+                assert runner.cancel(db, third).status == "cancelled"
+                assert runner.cancel(db, first).cancel_requested
+
+            release.set()
+
+            assert wait_for(session_factory, first).status == "cancelled"
+            assert wait_for(session_factory, second).result == {"steps": 1}
+        finally:
+            runner.shutdown(wait=True)
+
+    def test_resume_unfinished_jobs_after_restart(self, session_factory):
+        release = threading.Event()
+        release.set()
+        with session_factory() as db:
+            db.add_all(
+                [
+                    Job(kind="block", status="running", params={}),
+                    Job(kind="block", status="queued", params={"steps": 2}),
+                    Job(kind="block", status="succeeded", params={}),
+                ]
+            )
+            db.commit()
+
+        runner = JobRunner(session_factory, handlers=blocking_handlers(release))
+        try:
+            runner.start()
+
+            assert wait_for(session_factory, 1).status == "succeeded"
+            assert wait_for(session_factory, 2).result == {"steps": 2}
+            with session_factory() as db:
+                assert db.get(Job, 3).started_at is None
+        finally:
+            runner.shutdown(wait=True)
+
+    def test_unknown_kind_and_missing_job(self, session_factory):
+        runner = JobRunner(session_factory, handlers={})
+        with session_factory() as db:
+            with pytest.raises(InvalidJobException):
+                runner.submit(db, JobCreate(kind="missing"))
+            with pytest.raises(JobNotFoundException):
+                runner.get(db, 999)
@@ -36,4 +36,150 @@ class TestAPI:
     def test_get_faculties_empty(self, client):
         response = client.get("/faculties/")
         assert response.status_code == 200
-        assert response.json() == []
\ No newline at end of file
+        assert response.json() == []
+
+    def test_metrics_report_concurrency_limits(self, client):
+        client.get("/books/")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        concurrency = response.json()["concurrency"]
+        assert set(concurrency) == {"lookup", "scan", "write"}
+        assert concurrency["scan"]["completed"] >= 1
+
+    def test_metrics_report_coalescing(self, client, sample_branch_data: dict):
+        client.post("/branches/", json=sample_branch_data)
+        response = client.get(f"/branches/{sample_branch_data['name']}/books/Missing/copies")
+        assert response.json()["copies_count"] == 0
+        coalescing = client.get("/metrics").json()["coalescing"]
+        assert coalescing["executions"] >= 1
+        assert coalescing["in_flight"] == 0
+
+    def test_get_faculty_books_not_found(self, client):
+        response = client.get("/faculties/999/books")
+        assert response.status_code == 404
+        assert "message" in response.json()
+
+    def test_remove_faculties_requires_book_selection(self, client, sample_faculty_data: dict):
+        faculty = client.post("/faculties/", json=sample_faculty_data).json()
+        response = client.request("DELETE", "/books/faculties", json={"faculty_ids": [faculty["id"]]})
+        assert response.status_code == 400
+        assert "message" in response.json()
+
+    def test_get_books_rejects_unknown_sort_key(self, client):
+        response = client.get("/books/", params={"sort": "-pages"})
+        assert response.status_code == 400
+        assert "message" in response.json()
+
+    def test_read_books_sparse_fieldset(self, client, sample_branch_data: dict, sample_faculty_data: dict):
+        branch = client.post("/branches/", json=sample_branch_data).json()
+        faculty = client.post("/faculties/", json=sample_faculty_data).json()
+        book = {"title": "Optics", "author": "Newton", "branch_id": branch["id"], "faculty_ids": [faculty["id"]]}
+        book = client.post("/books/", json=book).json()
+
+        default = client.get("/books/").json()
+        assert default[0].keys() == book.keys()
+
+        sparse = client.get("/books/", params={"fields": "title,copies_available"}).json()
+        assert sparse == [{"id": book["id"], "title": "Optics", "copies_available": 0}]
+
+        expanded = client.get(f"/books/{book['id']}", params={"fields": "title", "expand": "faculties"}).json()
+        assert expanded == {"id": book["id"], "title": "Optics", "faculties": [faculty]}
+
+    def test_read_book_rejects_unknown_field(self, client):
+        response = client.get("/books/1", params={"fields": "title,secret"})
+        assert response.status_code == 400
+        assert "message" in response.json()
+
+    def test_create_branch_retry_with_idempotency_key(self, client, sample_branch_data: dict):
+        headers = {"Idempotency-Key": "branch-retry-1"}
+        first = client.post("/branches/", json=sample_branch_data, headers=headers)
+        second = client.post("/branches/", json=sample_branch_data, headers=headers)
+        assert first.json() == second.json()
+        assert second.headers["Idempotency-Replayed"] == "true"
+        assert len(client.get("/branches/").json()) == 1
+
+    def test_job_endpoints_report_errors(self, client):
+        assert client.get("/jobs/999").status_code == 404
+        response = client.post("/jobs/", json={"kind": "unknown"})
+        assert response.status_code == 400
+        assert "message" in response.json()
+
+    def test_bulk_delete_dry_run(self, client):
+        response = client.request("DELETE", "/books/", json={"filter": {"author": "Nobody"}, "dry_run": True})
+        assert response.status_code == 200
+        assert response.json() == {"affected": 0, "dry_run": True}
+
+    def test_bulk_update_rejects_null_for_required_fields(self, client):
+        changes = {"copies_available": None, "branch_id": None}
+        response = client.patch("/books/", json={"filter": {"author": "X"}, "changes": changes})
+        assert response.status_code == 422
+
+    def test_upsert_book_by_natural_key(self, client, sample_branch_data: dict):
+        branch = client.post("/branches/", json=sample_branch_data).json()
+        book = {"title": "Optics", "author": "Newton", "branch_id": branch["id"], "copies_available": 1}
+
+        created = client.put("/books/", json=book).json()
+        updated = client.put("/books/batch", json=[{**book, "copies_available": 3}]).json()
+
+        assert (created["inserted"], updated["updated"]) == (1, 1)
+        assert created["book_ids"] == updated["book_ids"]
+        assert client.get(f"/books/{created['book_ids'][0]}").json()["copies_available"] == 3
+
+    def test_changes_feed_pages_by_token(self, client, sample_branch_data: dict):
+        branch = client.post("/branches/", json=sample_branch_data).json()
+        client.put(f"/branches/{branch['id']}", json={**sample_branch_data, "address": "New"})
+
+        page = client.get("/changes", params={"since": 0}).json()
+
+        assert [(change["entity"], change["op"]) for change in page["changes"]] == [("branches", "update")]
+        assert page["changes"][0]["data"]["address"] == "New"
+        assert client.get("/changes", params={"since": page["next_token"]}).json()["changes"] == []
+        assert client.get("/changes", params={"since": -1}).status_code == 422
+
+    def test_reports_refresh_from_database(self, client, sample_branch_data: dict, monkeypatch):
+        import main
+        from analytics.analytics import BookAnalytics
+
+        monkeypatch.setattr(main, "book_analytics", BookAnalytics(min_refresh_interval=0))
+        branch = client.post("/branches/", json=sample_branch_data).json()
+        for title, price in (("Cheap", 5.0), ("Dear", 25.0)):
+            book = {
+                "title": title,
+                "author": "Author",
+                "price": price,
+                "copies_available": 2,
+                "branch_id": branch["id"],
+            }
+            client.post("/books/", json=book)
+
+        inventory = client.get("/reports/inventory", params={"group_by": "branch"}).json()
+        assert inventory["groups"] == [
+            {"key": branch["id"], "name": branch["name"], "books": 2, "copies": 4, "inventory_value": 60.0,
+             "avg_price": 15.0}
+        ]
+        prices = client.get("/reports/distribution", params={"percentiles": "50"}).json()
+        assert (prices["count"], prices["percentiles"]) == (2, {"50": 15.0})
+        top = client.get("/reports/top-books", params={"metric": "price", "n": 1}).json()
+        assert top["books"][0]["value"] == 25.0
+        assert client.get("/reports/inventory", params={"group_by": "author"}).status_code == 400
+        assert client.get("/reports/distribution", params={"percentiles": "x"}).status_code == 400
+
+    def test_lifespan_verifies_schema_and_reports_startup(self, db_session, monkeypatch):
+        import main
+        from fastapi.testclient import TestClient
+        from jobs.jobs import JobRunner
+        from migrations.migrations import migrate
+
+        engine = db_session.get_bind()
+        with engine.begin() as connection:
+            migrate(connection)
+        monkeypatch.setattr(main, "get_engine", lambda: engine)
+        monkeypatch.setattr(main, "warm_pool", lambda: None)
+        monkeypatch.setattr(main, "job_runner", JobRunner(lambda: db_session, handlers={}))
+        monkeypatch.setattr(main.job_runner, "resume", lambda: None)
+
+        with TestClient(main.app) as client:
+            startup = client.get("/metrics").json()["startup"]
+
+        assert set(startup["phases_ms"]) >= {"import", "database", "warm_up"}
+        assert set(startup["warm_up_tasks_ms"]) == {"connection_pool", "openapi", "job_runner"}
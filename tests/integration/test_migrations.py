@@ -0,0 +1,100 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+import pytest
+from exceptions.exceptions import SchemaVersionException
+from migrations.migrations import SCHEMA_VERSION, check_schema, migrate
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE branches (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, address VARCHAR)",
+    "CREATE TABLE faculties (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE)",
+    "CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, "
+    "publisher VARCHAR, year INTEGER, pages INTEGER, illustrations INTEGER, price FLOAT, "
+    "branch_id INTEGER REFERENCES branches (id), copies_available INTEGER, students_borrowed_count INTEGER)",
+    "CREATE TABLE book_faculty (book_id INTEGER REFERENCES books (id), faculty_id INTEGER REFERENCES faculties (id))",
+    "INSERT INTO branches (id, name) VALUES (1, 'Main'), (2, 'East')",
+    "INSERT INTO books (id, title, author, publisher, branch_id, copies_available) VALUES "
+    "(1, 'Optics', 'Newton', 'Royal Society', 1, 2), (2, 'Optics', 'Newton', 'Royal Society', 2, 5), "
+    "(3, 'Principia', 'Newton', NULL, 1, 1)",
+]
+
+
+class TestMigrations:
+    def test_migrate_books_to_works(self):
+        engine = create_engine("sqlite:///:memory:")
+
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+
+            migrate(connection)
+            migrate(connection)
+
+            works = connection.execute(text("SELECT id, title, author FROM works ORDER BY title")).all()
+            links = connection.execute(text("SELECT id, work_id FROM books ORDER BY id")).all()
+            indexes = {index["name"] for index in inspect(connection).get_indexes("book_faculty")}
+
+        assert [(work.title, work.author) for work in works] == [("Optics", "Newton"), ("Principia", "Newton")]
+        assert links[0].work_id == links[1].work_id == works[0].id
+        assert links[2].work_id == works[1].id
+        assert "ix_book_faculty_faculty_id_book_id" in indexes
+
+    def test_migrate_backfills_change_log(self):
+        engine = create_engine("sqlite:///:memory:")
+
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO faculties (id, name) VALUES (1, 'Physics')"))
+            connection.execute(text("INSERT INTO book_faculty (book_id, faculty_id) VALUES (3, 1), (1, 1)"))
+
+            migrate(connection)
+            migrate(connection)
+
+            changes = connection.execute(text("SELECT entity, entity_key, op FROM changes ORDER BY seq")).all()
+
+        assert [tuple(change) for change in changes] == [
+            ("branches", "1", "insert"),
+            ("branches", "2", "insert"),
+            ("faculties", "1", "insert"),
+            ("books", "1", "insert"),
+            ("books", "2", "insert"),
+            ("books", "3", "insert"),
+            ("book_faculty", "1:1", "insert"),
+            ("book_faculty", "3:1", "insert"),
+        ]
+
+    def test_migrate_makes_book_faculty_links_unique(self):
+        engine = create_engine("sqlite:///:memory:")
+
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO faculties (id, name) VALUES (1, 'Physics')"))
+            connection.execute(text("INSERT INTO book_faculty (book_id, faculty_id) VALUES (1, 1), (1, 1), (2, 1)"))
+            connection.execute(
+                text("CREATE INDEX ix_book_faculty_faculty_id_book_id ON book_faculty (faculty_id, book_id)")
+            )
+
+            migrate(connection)
+
+            links = connection.execute(text("SELECT book_id, faculty_id FROM book_faculty ORDER BY book_id")).all()
+            indexes = {index["name"]: index for index in inspect(connection).get_indexes("book_faculty")}
+            with pytest.raises(IntegrityError):
+                connection.execute(text("INSERT INTO book_faculty (book_id, faculty_id) VALUES (2, 1)"))
+
+        assert [tuple(link) for link in links] == [(1, 1), (2, 1)]
+        assert indexes["ix_book_faculty_faculty_id_book_id"]["unique"]
+
+    def test_check_schema_requires_current_version(self):
+        engine = create_engine("sqlite:///:memory:")
+
+        with engine.begin() as connection:
+            with pytest.raises(SchemaVersionException):
+                check_schema(connection)
+
+            migrate(connection)
+            check_schema(connection)
+
+            connection.execute(text("UPDATE schema_version SET version = :version"), {"version": SCHEMA_VERSION - 1})
+            with pytest.raises(SchemaVersionException):
+                check_schema(connection)
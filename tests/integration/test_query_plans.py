@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from schemas.schemas import BookFilter
+from crud.crud import books_query
+
+ROWS = 1_000_000
+
+INDEX_STATS = {
+    "books": {
+        None: f"{ROWS}",
+        "ix_books_id": f"{ROWS} 1",
+        "ix_books_title": f"{ROWS} 2",
+        "ix_books_author": f"{ROWS} 20",
+        "ix_books_publisher": f"{ROWS} 2000",
+        "ix_books_year": f"{ROWS} 10000",
+        "ix_books_price": f"{ROWS} 100",
+        "ix_books_branch_id": f"{ROWS} 5000",
+        "ix_books_work_id": f"{ROWS} 2",
+        "ix_books_copies_available": f"{ROWS} 50000",
+        "ix_books_in_stock": f"{ROWS * 3 // 5} 1",
+        "ix_books_in_stock_title": f"{ROWS * 3 // 5} 2 1",
+        "ix_books_in_stock_price": f"{ROWS * 3 // 5} 100 1",
+        "uq_books_title_author_branch": f"{ROWS} 2 1 1",
+    },
+    "book_faculty": {
+        None: f"{ROWS * 3}",
+        "ix_book_faculty_faculty_id_book_id": f"{ROWS * 3} 30000 1",
+    },
+}
+
+# Частичные индексы уже содержат только книги в наличии: упорядоченный обход такого индекса с LIMIT не читает таблицу
+IN_STOCK_SCANS = {
+    None: "SCAN books USING INDEX ix_books_in_stock",
+    "title": "SCAN books USING INDEX ix_books_in_stock_title",
+    "-price": "SCAN books USING INDEX ix_books_in_stock_price",
+}
+
+COMMON_FILTERS = [
+    BookFilter(branch_id=1),
+    BookFilter(author="Newton"),
+    BookFilter(publisher="Royal Society"),
+    BookFilter(year_min=2000, year_max=2005),
+    BookFilter(price_min=10.0, price_max=20.0),
+    BookFilter(in_stock=True),
+    BookFilter(faculty_id=3),
+    BookFilter(branch_id=1, in_stock=True),
+]
+
+
+@pytest.fixture
+def planner():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+
+    # Статистика планировщика как у таблицы на миллион строк, без загрузки самих данных
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+        connection.execute(text("DELETE FROM sqlite_stat1"))
+        for table, indexes in INDEX_STATS.items():
+            for index, stat in indexes.items():
+                connection.execute(
+                    text("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (:tbl, :idx, :stat)"),
+                    {"tbl": table, "idx": index, "stat": stat},
+                )
+        connection.execute(text("ANALYZE sqlite_schema"))
+
+    session = sessionmaker(bind=engine)()
+
+    def explain(query):
+        sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        with engine.connect() as connection:
+            return [row[3] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+    try:
+        yield session, explain
+    finally:
+        session.close()
+        engine.dispose()
+
+
+class TestBookFilterQueryPlans:
+    @pytest.mark.parametrize("book_filter", COMMON_FILTERS, ids=lambda f: ",".join(f.model_dump(exclude_none=True)))
+    @pytest.mark.parametrize("sort", [None, "title", "-price"])
+    def test_common_filters_use_indexes(self, planner, book_filter, sort):
+        session, explain = planner
+
+        plan = explain(books_query(session, book_filter, sort, skip=0, limit=50))
+
+        allowed = {IN_STOCK_SCANS[sort]} if book_filter.in_stock and book_filter.branch_id is None else set()
+        assert not any(step.startswith("SCAN books") and step not in allowed for step in plan), plan
+        assert any("INDEX" in step or "PRIMARY KEY" in step for step in plan)
@@ -0,0 +1,155 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.event import listen
+from sqlalchemy.orm import sessionmaker
+from models.models import Base, Book
+from schemas.schemas import (
+    BookBulkDelete,
+    BookBulkUpdate,
+    BookCreate,
+    BookFilter,
+    BookPatch,
+    BookUpdate,
+    BranchCreate,
+    FacultyAssignment,
+    FacultyCreate,
+)
+from exceptions.exceptions import BookNotFoundException, BranchNotFoundException
+from main import app, get_read_model
+from readmodel.readmodel import ReadModel
+import crud.crud as crud
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def catalog(db_session):
+    main_branch = crud.create_branch(db_session, BranchCreate(name="Main", address="Центральная, 1"))
+    north = crud.create_branch(db_session, BranchCreate(name="North"))
+    physics = crud.create_faculty(db_session, FacultyCreate(name="Physics"))
+    optics = crud.create_faculty(db_session, FacultyCreate(name="Optics"))
+    records = [
+        BookCreate(
+            title="Optics",
+            author="Newton",
+            branch_id=main_branch.id,
+            copies_available=3,
+            faculty_ids=[physics.id, optics.id],
+        ),
+        BookCreate(title="Optics", author="Huygens", branch_id=main_branch.id, copies_available=7),
+        BookCreate(title="Optics", author="Newton", branch_id=north.id, copies_available=1),
+    ]
+    books = [crud.create_book(db_session, record) for record in records]
+    return main_branch, north, physics, books
+
+
+@pytest.fixture
+def read_model(db_session, monkeypatch):
+    model = ReadModel()
+    model.load(db_session)
+    monkeypatch.setattr(crud, "change_listeners", [model.on_commit])
+    return model
+
+
+def count_queries(db_session):
+    statements = []
+    listen(db_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+class TestReadModel:
+    def test_lookups_match_database_without_queries(self, db_session, catalog, read_model):
+        statements = count_queries(db_session)
+
+        assert read_model.get_book_copies_in_branch("Main", "Optics") == 3
+        assert read_model.get_book_copies_in_branch("North", "Missing") == 0
+        assert read_model.get_book_faculties_in_branch("Optics", "Main") == {
+            "book_title": "Optics",
+            "branch_name": "Main",
+            "faculties_count": 2,
+            "faculties": ["Physics", "Optics"],
+        }
+        assert [(branch.name, branch.address) for branch in read_model.get_branches()] == [
+            ("Main", "Центральная, 1"),
+            ("North", None),
+        ]
+        assert [faculty.name for faculty in read_model.get_faculties()] == ["Physics", "Optics"]
+        with pytest.raises(BranchNotFoundException):
+            read_model.get_book_copies_in_branch("South", "Optics")
+        with pytest.raises(BookNotFoundException):
+            read_model.get_book_faculties_in_branch("Missing", "North")
+
+        assert statements == []
+        assert read_model.stats()["books"] == 3
+        assert read_model.stats()["mb_per_million_books"] > 0
+
+    def test_crud_writes_keep_model_current(self, db_session, catalog, read_model):
+        main_branch, north, physics, books = catalog
+
+        crud.delete_book(db_session, books[0].id)
+        assert read_model.get_book_copies_in_branch("Main", "Optics") == 7
+        north_books = BookFilter(branch_id=north.id)
+        crud.update_books(db_session, BookBulkUpdate(filter=north_books, changes=BookPatch(copies_available=5)))
+        crud.assign_faculties(db_session, FacultyAssignment(faculty_ids=[physics.id], book_ids=[books[2].id]))
+        crud.update_branch(db_session, north.id, BranchCreate(name="Northern"))
+        crud.create_book(db_session, BookCreate(title="Elements", author="Euclid", branch_id=north.id))
+        crud.delete_books(db_session, BookBulkDelete(filter=BookFilter(author="Huygens")))
+
+        assert read_model.get_book_copies_in_branch("Main", "Optics") == 0
+        assert read_model.get_book_copies_in_branch("Northern", "Optics") == 5
+        assert read_model.get_book_faculties_in_branch("Optics", "Northern")["faculties"] == ["Physics"]
+        assert read_model.get_book_faculties_in_branch("Elements", "Northern")["faculties"] == []
+        with pytest.raises(BranchNotFoundException):
+            read_model.get_book_copies_in_branch("North", "Optics")
+        assert read_model.verify(db_session)
+        assert read_model.reloads == 1
+
+    def test_books_without_branch_are_kept_out_of_lookups(self, db_session, catalog, read_model):
+        main_branch, north, physics, books = catalog
+
+        crud.update_book(db_session, books[0].id, BookUpdate(title="Optics", author="Newton", branch_id=None))
+        assert read_model.ready
+        assert read_model.get_book_copies_in_branch("Main", "Optics") == 7
+
+        read_model.load(db_session)
+        assert read_model.stats()["books"] == 3
+        crud.update_book(db_session, books[0].id, BookUpdate(title="Optics", author="Newton", branch_id=main_branch.id))
+        assert read_model.get_book_copies_in_branch("Main", "Optics") == 3
+        assert read_model.verify(db_session)
+
+    def test_verify_catches_up_with_writes_outside_crud(self, db_session, catalog, read_model):
+        main_branch, north, physics, books = catalog
+        db_session.execute(update(Book).where(Book.id == books[2].id).values(copies_available=9))
+        crud._record_changes(db_session, "books", "update", [books[2].id])
+        db_session.commit()
+
+        assert read_model.get_book_copies_in_branch("North", "Optics") == 1
+        assert not read_model.verify(db_session)
+        assert read_model.get_book_copies_in_branch("North", "Optics") == 9
+        assert read_model.verify(db_session)
+
+    def test_endpoints_serve_from_model(self, db_session, catalog, read_model):
+        app.dependency_overrides[get_read_model] = lambda: read_model
+        try:
+            client = TestClient(app)
+            statements = count_queries(db_session)
+
+            assert client.get("/branches/Main/books/Optics/copies").json()["copies_count"] == 3
+            assert client.get("/books/Optics/branches/Main/faculties").json()["faculties_count"] == 2
+            assert [branch["name"] for branch in client.get("/branches/").json()] == ["Main", "North"]
+            assert [faculty["name"] for faculty in client.get("/faculties/").json()] == ["Physics", "Optics"]
+            assert client.get("/branches/South/books/Optics/copies").status_code == 404
+            assert statements == []
+        finally:
+            app.dependency_overrides.clear()
@@ -0,0 +1,177 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app, get_shards
+from models.models import Book
+from schemas.schemas import (
+    BookBulkUpdate,
+    BookCreate,
+    BookFilter,
+    BookPatch,
+    BookUpdate,
+    BranchCreate,
+    FacultyAssignment,
+    FacultyCreate,
+)
+from exceptions.exceptions import InvalidBookDataException, ShardPlacementException
+from sharding.sharding import SHARD_ID_SPAN, ShardMap
+import crud.crud as crud
+
+
+@pytest.fixture
+def shards(tmp_path):
+    urls = [f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(3)]
+    shard_map = ShardMap(urls, assignments={4: 0}, connect_args={"check_same_thread": False})
+    shard_map.create_all()
+    try:
+        yield shard_map
+    finally:
+        shard_map.dispose()
+
+
+@pytest.fixture
+def catalog(shards):
+    branches = [crud.sharded_create_branch(shards, BranchCreate(name=f"Branch {index}")) for index in range(1, 5)]
+    physics = crud.sharded_create_faculty(shards, FacultyCreate(name="Physics"))
+    books = [
+        crud.sharded_create_book(
+            shards,
+            BookCreate(
+                title=f"Book {index:02d}",
+                author="Author",
+                price=float(index % 4) if index % 5 else None,
+                branch_id=branches[index % 4].id,
+                copies_available=index,
+                faculty_ids=[physics.id] if index % 2 else [],
+            ),
+        )
+        for index in range(12)
+    ]
+    return branches, physics, books
+
+
+def shard_books(shard_map, shard):
+    return shard_map.call(shard, lambda db: sorted(book.id for book in db.query(Book)))
+
+
+class TestShardMap:
+    def test_branches_are_replicated_and_books_routed(self, shards, catalog):
+        branches, physics, books = catalog
+
+        for shard in shards.shards:
+            assert [branch.name for branch in shards.call(shard, crud.get_branches)] == [
+                branch.name for branch in branches
+            ]
+            assert [faculty.id for faculty in shards.call(shard, crud.get_faculties)] == [physics.id]
+
+        assert shards.shard_for_branch(4) is shards.home
+        for book in books:
+            shard = shards.shard_for_branch(book.branch_id)
+            assert shards.shard_for_book(book.id) is shard
+            assert shard.index * SHARD_ID_SPAN < book.id <= (shard.index + 1) * SHARD_ID_SPAN
+            assert book.id in shard_books(shards, shard)
+
+    def test_scatter_gather_pagination_matches_global_order(self, shards, catalog):
+        _, _, books = catalog
+        expected = sorted(books, key=lambda book: (book.price is not None, book.price or 0, -book.id))
+        expected = [book.id for book in reversed(expected)]
+
+        pages = [
+            crud.sharded_get_books(shards, BookFilter(), "-price", skip, 5, *crud.parse_book_fieldset("title,price"))
+            for skip in range(0, 15, 5)
+        ]
+
+        assert [book.id for page in pages for book in page] == expected
+        assert set(type(pages[0][0]).model_fields) == {"id", "title", "price"}
+
+    def test_branch_scoped_reads_touch_one_shard(self, shards, catalog):
+        branches, physics, _ = catalog
+
+        branch_books = crud.sharded_get_books(shards, BookFilter(branch_id=branches[1].id), "title", 0, 10)
+
+        assert [book.title for book in branch_books] == ["Book 01", "Book 05", "Book 09"]
+        assert crud.sharded_get_book_copies_in_branch(shards, "Branch 2", "Book 05") == 5
+        assert crud.sharded_get_book_faculties_in_branch(shards, "Book 05", "Branch 2")["faculties"] == ["Physics"]
+
+        faculty_books = crud.sharded_get_faculty_books(shards, physics.id, skip=2, limit=3)
+
+        assert (faculty_books["total_books"], faculty_books["total_copies"]) == (6, 36)
+        assert [book["title"] for book in faculty_books["books"]] == ["Book 05", "Book 07", "Book 09"]
+
+    def test_writes_are_routed_by_book_and_filter(self, shards, catalog):
+        branches, physics, books = catalog
+
+        changes = BookUpdate(title="Book 03", author="Author", copies_available=30)
+        updated = crud.sharded_update_book(shards, books[3].id, changes)
+        assert crud.sharded_get_book(shards, books[3].id).copies_available == updated.copies_available == 30
+
+        with pytest.raises(InvalidBookDataException):
+            moved = BookUpdate(title="Book 03", author="Author", branch_id=branches[1].id)
+            crud.sharded_update_book(shards, books[3].id, moved)
+
+        bulk = BookBulkUpdate(filter=BookFilter(author="Author"), changes=BookPatch(copies_available=1))
+        assert crud.sharded_update_books(shards, bulk)["affected"] == 12
+
+        assignment = FacultyAssignment(faculty_ids=[physics.id], book_ids=[books[1].id])
+        removed = crud.sharded_remove_faculties(shards, assignment)
+        assert removed["affected"] == 1
+
+        crud.sharded_delete_book(shards, books[0].id)
+        assert crud.sharded_get_book(shards, books[0].id) is None
+
+    def test_upsert_splits_records_by_shard(self, shards, catalog):
+        branches, _, books = catalog
+        records = [
+            BookCreate(title="Book 01", author="Author", branch_id=branches[1].id, copies_available=7),
+            BookCreate(title="New", author="Author", branch_id=branches[2].id),
+            BookCreate(title="Book 00", author="Author", branch_id=branches[0].id, copies_available=0),
+        ]
+
+        result = crud.sharded_upsert_books(shards, records)
+
+        assert (result["inserted"], result["updated"], result["unchanged"]) == (1, 1, 1)
+        assert result["book_ids"][0] == books[1].id
+        assert result["book_ids"][2] == books[0].id
+        assert shards.shard_for_book(result["book_ids"][1]) is shards.shard_for_branch(branches[2].id)
+
+    def test_engines_are_created_on_first_use(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SHARD_DATABASE_URLS", f"sqlite:///{tmp_path / 'a.db'}, sqlite:///{tmp_path / 'b.db'}")
+        shard_map = ShardMap.from_env()
+        try:
+            assert [shard._engine for shard in shard_map.shards] == [None, None]
+            assert shard_map.call(shard_map.home, lambda db: db.get_bind().url.database).endswith("a.db")
+            assert [shard._engine is not None for shard in shard_map.shards] == [True, False]
+        finally:
+            shard_map.dispose()
+
+    def test_check_placement_rejects_books_on_foreign_shard(self, shards):
+        branch = crud.sharded_create_branch(shards, BranchCreate(name="Branch 1"))
+        shards.check_placement()
+
+        assert shards.shard_for_branch(branch.id) is not shards.home
+        shards.call(
+            shards.home, lambda db: crud.create_book(db, BookCreate(title="A", author="B", branch_id=branch.id))
+        )
+        with pytest.raises(ShardPlacementException):
+            shards.check_placement()
+
+    def test_api_uses_shard_map(self, shards):
+        app.dependency_overrides[get_shards] = lambda: shards
+        try:
+            client = TestClient(app)
+            branch = client.post("/branches/", json={"name": "Branch 1"}).json()
+            book = {"title": "Optics", "author": "Newton", "branch_id": branch["id"]}
+            book = client.post("/books/", json=book).json()
+
+            assert book["id"] > SHARD_ID_SPAN
+            assert client.get(f"/books/{book['id']}").json()["title"] == "Optics"
+            assert [item["id"] for item in client.get("/books/").json()] == [book["id"]]
+            assert client.get(f"/books/{SHARD_ID_SPAN * 10}").status_code == 404
+            for path in ("/works/", "/works/1/availability", "/changes", "/reports/inventory", "/reports/top-books"):
+                assert client.get(path).status_code == 501
+            job = {
+                "kind": "import_books",
+                "params": {"books": [{"title": "A", "author": "B", "branch_id": branch["id"]}]},
+            }
+            assert client.post("/jobs/", json=job).status_code == 501
+        finally:
+            app.dependency_overrides.clear()
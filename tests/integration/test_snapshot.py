@@ -0,0 +1,112 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from models.models import Base, Book, Branch, Change, Faculty
+from migrations.migrations import check_schema
+from schemas.schemas import BookCreate
+from exceptions.exceptions import SnapshotException
+from snapshot.snapshot import SnapshotReader, dump, main, restore
+import crud.crud as crud
+
+
+def sqlite_engine(path):
+    return create_engine(f"sqlite:///{path}")
+
+
+def session(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+@pytest.fixture
+def source(tmp_path):
+    engine = sqlite_engine(tmp_path / "source.db")
+    Base.metadata.create_all(bind=engine)
+    with session(engine) as db:
+        main_branch, north = Branch(name="Main", address="Центральная, 1"), Branch(name="North")
+        physics = Faculty(name="Физика")
+        db.add_all([main_branch, north, physics])
+        db.commit()
+        records = [
+            BookCreate(
+                title="Оптика",
+                author="Newton",
+                price=9.5,
+                branch_id=main_branch.id,
+                copies_available=3,
+                faculty_ids=[physics.id],
+            ),
+            BookCreate(title="Optics", author="Newton", branch_id=north.id, faculty_ids=[physics.id]),
+            BookCreate(title="Elements", author="Euclid", year=1482, branch_id=north.id),
+        ]
+        for record in records:
+            crud.create_book(db, record)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def table_rows(engine, model):
+    with session(engine) as db:
+        return [
+            {column.name: getattr(row, column.name) for column in model.__table__.columns}
+            for row in db.query(model).order_by(model.id)
+        ]
+
+
+class TestSnapshot:
+    def test_dump_is_readable_through_mmap(self, source, tmp_path):
+        path = str(tmp_path / "library.snap")
+
+        counts = dump(source, path)
+
+        assert counts == {"branches": 2, "faculties": 1, "works": 3, "books": 3, "book_faculty": 2}
+        with SnapshotReader(path) as reader:
+            assert reader.tables == counts
+            assert reader.column("books", "title") == ["Оптика", "Optics", "Elements"]
+            assert reader.column("books", "price") == [9.5, None, None]
+            assert reader.column("branches", "address") == ["Центральная, 1", None]
+            assert reader.rows("book_faculty") == [{"book_id": 1, "faculty_id": 1}, {"book_id": 2, "faculty_id": 1}]
+            assert reader.stats()["books"]["rows"] == 3
+
+    def test_restore_round_trip(self, source, tmp_path):
+        path = str(tmp_path / "library.snap")
+        dump(source, path)
+        target = sqlite_engine(tmp_path / "target.db")
+
+        restore(target, path)
+
+        for model in (Branch, Faculty, Book):
+            assert table_rows(target, model) == table_rows(source, model)
+        with target.connect() as connection:
+            check_schema(connection)
+            changes = connection.execute(select(Change.entity, Change.entity_key)).all()
+        assert {(entity, key) for entity, key in changes} >= {("books", "1"), ("books", "3"), ("book_faculty", "2:1")}
+        with session(target) as db:
+            created = crud.create_book(db, BookCreate(title="New", author="Author", branch_id=1))
+            assert created.id == 4
+            assert [faculty.name for faculty in crud.get_book(db, 2).faculties] == ["Физика"]
+
+        with pytest.raises(SnapshotException):
+            restore(target, path)
+        target.dispose()
+
+    def test_restore_branch_subset_from_cli(self, source, tmp_path, capsys):
+        path = str(tmp_path / "library.snap")
+        target_url = f"sqlite:///{tmp_path / 'north.db'}"
+
+        main(["dump", path, "--url", f"sqlite:///{tmp_path / 'source.db'}"])
+        main(["restore", path, "--url", target_url, "--branch", "2"])
+
+        target = create_engine(target_url)
+        assert [branch["name"] for branch in table_rows(target, Branch)] == ["North"]
+        assert [book["title"] for book in table_rows(target, Book)] == ["Optics", "Elements"]
+        target.dispose()
+        assert '"book_faculty": 1' in capsys.readouterr().out
+
+    def test_rejects_non_snapshot_file(self, tmp_path):
+        path = tmp_path / "broken.snap"
+        path.write_bytes(b"not a snapshot at all")
+
+        with pytest.raises(SnapshotException):
+            SnapshotReader(str(path))
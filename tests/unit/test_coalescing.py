@@ -0,0 +1,50 @@
+import threading
+import time
+import pytest
+from coalescing.coalescing import SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 7
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", load)))
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", load))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        deadline = time.monotonic() + 5
+        while flight.stats()["coalesced"] < 3:
+            assert time.monotonic() < deadline, "followers did not join the in-flight call"
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        assert results == [7, 7, 7, 7]
+        assert len(calls) == 1
+        assert flight.stats() == {"executions": 1, "coalesced": 3, "in_flight": 0}
+
+    def test_error_is_shared_and_key_released(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("key", fail)
+
+        assert flight.do("key", lambda: 1) == 1
+        assert flight.stats()["executions"] == 2
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from middleware.middleware import (
+    AdaptiveLimiter,
+    ConcurrencyLimitMiddleware,
+    IdempotencyMiddleware,
+    IdempotencyStore,
+)
+
+
+class TestAdaptiveLimiter:
+    def test_acquire_within_limit(self):
+        limiter = AdaptiveLimiter("lookup", max_limit=2)
+
+        async def scenario():
+            return [await limiter.acquire(), await limiter.acquire(), await limiter.acquire()]
+
+        assert asyncio.run(scenario()) == [True, True, False]
+        assert limiter.stats()["in_flight"] == 2
+        assert limiter.stats()["rejected"] == 1
+
+    def test_queued_request_gets_released_slot(self):
+        limiter = AdaptiveLimiter("write", max_limit=1, max_queue=1, queue_timeout=1.0)
+
+        async def scenario():
+            await limiter.acquire()
+            waiting = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            assert limiter.stats()["queued"] == 1
+            limiter.release(0.01)
+            return await waiting
+
+        assert asyncio.run(scenario()) is True
+        assert limiter.stats()["in_flight"] == 1
+
+    def test_cancelled_request_gives_back_granted_slot(self):
+        limiter = AdaptiveLimiter("write", max_limit=1, max_queue=2, queue_timeout=1.0)
+
+        async def scenario():
+            await limiter.acquire()
+            cancelled = asyncio.ensure_future(limiter.acquire())
+            waiting = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            limiter.release(0.01)
+            try:
+                await cancelled
+            except asyncio.CancelledError:
+                pass
+            return await waiting
+
+        assert asyncio.run(scenario()) is True
+        assert limiter.stats()["in_flight"] == 1
+        assert limiter.stats()["queued"] == 0
+
+    def test_queued_request_times_out(self):
+        limiter = AdaptiveLimiter("scan", max_limit=1, max_queue=1, queue_timeout=0.01)
+
+        async def scenario():
+            await limiter.acquire()
+            return await limiter.acquire()
+
+        assert asyncio.run(scenario()) is False
+        assert limiter.stats()["queued"] == 0
+        assert limiter.retry_after() >= 1
+
+    def test_limit_shrinks_when_latency_grows(self):
+        limiter = AdaptiveLimiter("scan", max_limit=20, min_limit=2)
+        limiter.in_flight = 20
+
+        for _ in range(50):
+            limiter.release(0.01)
+            limiter.in_flight += 1
+        for _ in range(50):
+            limiter.release(1.0)
+            limiter.in_flight += 1
+
+        assert 2 <= limiter.current_limit < 20
+
+
+class TestConcurrencyLimitMiddleware:
+    def test_rejects_with_retry_after_when_saturated(self):
+        app = FastAPI()
+
+        @app.get("/books/")
+        def read_books():
+            return []
+
+        @app.get("/")
+        def read_root():
+            return {}
+
+        scan = AdaptiveLimiter("scan", max_limit=1)
+        scan.in_flight = 1
+        app.add_middleware(
+            ConcurrencyLimitMiddleware, routes=app.router.routes, limiters={"scan": scan}, exempt_routes={"/"}
+        )
+        client = TestClient(app)
+
+        response = client.get("/books/")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.get("/").status_code == 200
+
+
+def idempotent_app(handler):
+    app = FastAPI()
+    app.post("/items/")(handler)
+    store = IdempotencyStore()
+    app.add_middleware(IdempotencyMiddleware, store=store)
+    return app, store
+
+
+class TestIdempotencyMiddleware:
+    def test_retry_replays_stored_response(self):
+        calls = []
+
+        def create_item(item: dict):
+            calls.append(item)
+            return {"id": len(calls), **item}
+
+        app, store = idempotent_app(create_item)
+        client = TestClient(app)
+        headers = {"Idempotency-Key": "abc"}
+
+        first = client.post("/items/", json={"name": "x"}, headers=headers)
+        second = client.post("/items/", json={"name": "x"}, headers=headers)
+
+        assert first.json() == second.json() == {"id": 1, "name": "x"}
+        assert second.headers["Idempotency-Replayed"] == "true"
+        assert len(calls) == 1
+        assert store.stats() == {"stored": 1, "in_flight": 0, "replayed": 1}
+
+        client.post("/items/", json={"name": "x"})
+        assert len(calls) == 2
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        app, _ = idempotent_app(lambda item: item)
+        client = TestClient(app)
+
+        client.post("/items/", json={"name": "x"}, headers={"Idempotency-Key": "abc"})
+        response = client.post("/items/", json={"name": "y"}, headers={"Idempotency-Key": "abc"})
+
+        assert response.status_code == 422
+
+    def test_concurrent_duplicate_waits_for_first_attempt(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def create_item(item: dict):
+            calls.append(item)
+            started.set()
+            release.wait(5)
+            return {"id": len(calls)}
+
+        app, store = idempotent_app(create_item)
+        client = TestClient(app)
+        responses = []
+
+        def post():
+            responses.append(client.post("/items/", json={"name": "x"}, headers={"Idempotency-Key": "abc"}))
+
+        first = threading.Thread(target=post)
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=post)
+        second.start()
+        deadline = time.monotonic() + 5
+        while store.stats()["in_flight"] == 1 and not store._pending[("POST", "/items/", "abc")].waiters:
+            assert time.monotonic() < deadline, "duplicate request did not wait for the first attempt"
+            time.sleep(0.001)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        assert [response.json() for response in responses] == [{"id": 1}, {"id": 1}]
+        assert len(calls) == 1
+
+    def test_expired_responses_are_evicted(self):
+        store = IdempotencyStore(ttl=0)
+
+        async def scenario():
+            store.claim("key", "fingerprint")
+            store.complete("key", 200, [], b"{}")
+            return store.claim("key", "fingerprint")
+
+        assert asyncio.run(scenario()) == (None, None)
+        assert store.stats()["stored"] == 0
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+import pytest
+from startup.startup import StartupProfile
+
+
+class TestStartupProfile:
+    def test_warm_up_runs_tasks_in_parallel(self):
+        profile = StartupProfile()
+        barrier = threading.Barrier(2, timeout=5)
+
+        asyncio.run(profile.warm_up({"first": barrier.wait, "second": barrier.wait}))
+        profile.mark("import")
+
+        report = profile.report()
+        assert set(report["warm_up_tasks_ms"]) == {"first", "second"}
+        assert set(report["phases_ms"]) == {"warm_up", "import"}
+        assert report["total_ms"] >= report["phases_ms"]["warm_up"]
+
+    def test_failed_task_is_timed_and_raised(self):
+        profile = StartupProfile()
+
+        def fail():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(profile.warm_up({"fail": fail}))
+
+        assert "fail" in profile.report()["warm_up_tasks_ms"]